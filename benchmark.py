@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from memory_model import BOARD_SIZES, FOUND, REVEALED
+
+# Keep stdout machine-readable
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160)
+}
+
+
+def parse_resolution(value):
+    if value.lower() in RESOLUTIONS:
+        return RESOLUTIONS[value.lower()]
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def peak_rss_kb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, Linux reports kilobytes
+        return peak // 1024 if sys.platform == "darwin" else peak
+    except ImportError:
+        return None
+
+
+def timed_frames(frames, step):
+    start = time.perf_counter()
+    for _ in range(frames):
+        step()
+    seconds = time.perf_counter() - start
+    return {"frames": frames, "seconds": round(seconds, 4), "fps": round(frames / seconds, 1) if seconds else None}
+
+
+def timed_animation(game, begin, frame_ms=16):
+    # Step the scheduler with a fixed delta so animations take the same number of frames everywhere
+    start = time.perf_counter()
+    begin()
+    frames = 0
+    while game.animations.busy():
+        game.animations.update(frame_ms)
+        game.render_frame()
+        frames += 1
+    seconds = time.perf_counter() - start
+    return {"frames": frames, "seconds": round(seconds, 4), "fps": round(frames / seconds, 1) if seconds else None}
+
+
+def run_child(args):
+    # Dummy drivers must be set before pygame is imported
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    if args.cache_dir:
+        os.environ["MONGOGAME_CACHE_DIR"] = args.cache_dir
+    os.environ["MONGOGAME_INPUT_LOG"] = ""
+    os.environ["MONGOGAME_TELEMETRY_DIR"] = ""
+    os.environ["MONGOGAME_FRAME_STATS"] = ""
+    random.seed(args.seed)
+    # Progress goes to a throwaway save store, never the real game_save.db
+    save_dir = tempfile.TemporaryDirectory()
+    
+    start = time.perf_counter()
+    import mongogame
+    game = mongogame.MemoryGame(resolution=parse_resolution(args.child), fullscreen=False, seed=args.seed,
+                                canvas=args.canvas or "", save_path=os.path.join(save_dir.name, "game_save.db"))
+    startup = time.perf_counter() - start
+    
+    # Force every asset to finish loading
+    start = time.perf_counter()
+    for group in (game.background_images, game.loaded_images):
+        group.prefetch()
+        for name in group.keys():
+            group[name]
+    game.audio.prefetch(list(game.audio.sources))
+    for name in game.audio.sources:
+        game.audio.sound(name)
+    asset_load = time.perf_counter() - start
+    
+    scenarios = {}
+    totals = {}
+    boards = []
+    for level in range(1, args.levels + 1):
+        # Boards grow with the level, so each run draws the next size up
+        game.level = level
+        level_start = time.perf_counter()
+        tiles = game.create_level()
+        game.animations.clear()
+        game.model.hide_all()
+        game.phase = "play"
+        game.render_frame()
+        create_ms = (time.perf_counter() - level_start) * 1000
+        totals.setdefault("create_level_ms", []).append(round(create_ms, 3))
+        
+        def full_redraw():
+            game.invalidate()
+            game.render_frame()
+        scenarios.setdefault("draw_tiles_full", []).append(timed_frames(args.frames, full_redraw))
+        
+        def dirty_redraw():
+            tile = random.choice(tiles)
+            game.model.state[tile.index] ^= REVEALED
+            game.render_frame()
+        scenarios.setdefault("draw_tiles_dirty", []).append(timed_frames(args.frames, dirty_redraw))
+        
+        def draw_all_tiles():
+            for tile in tiles:
+                tile.draw(game.screen, game.atlas, game.frame_cache)
+        scenarios.setdefault("tile_draw", []).append(timed_frames(args.frames, draw_all_tiles))
+        
+        scenarios.setdefault("shake_tiles", []).append(timed_animation(game, lambda: game.shake_tiles(tiles[:2])))
+        
+        def celebrate():
+            for tile in tiles[:2]:
+                game.model.state[tile.index] |= FOUND
+                tile.celebrate(game.animations)
+        scenarios.setdefault("celebrate", []).append(timed_animation(game, celebrate))
+        
+        boards.append({
+            "level": level,
+            "board": f"{game.cols}x{game.rows}",
+            "tiles": len(tiles),
+            "fps": {name: runs[-1]["fps"] for name, runs in scenarios.items()}
+        })
+    
+    # Collapse per-level runs into one figure per scenario
+    summary = {}
+    for name, runs in scenarios.items():
+        frames = sum(run["frames"] for run in runs)
+        seconds = sum(run["seconds"] for run in runs)
+        summary[name] = {"frames": frames, "seconds": round(seconds, 4), "fps": round(frames / seconds, 1) if seconds else None}
+    
+    result = {
+        "resolution": args.child,
+        "canvas": f"{game.SCREEN_WIDTH}x{game.SCREEN_HEIGHT}",
+        "window": "x".join(map(str, mongogame.pygame.display.get_window_size())),
+        "startup_s": round(startup, 4),
+        "asset_load_s": round(asset_load, 4),
+        "create_level_ms": totals["create_level_ms"],
+        "peak_rss_kb": peak_rss_kb(),
+        "scenarios": summary,
+        "boards": boards,
+        "text_cache": game.text_cache.stats(),
+        "surfaces": game.surfaces.stats(),
+        "audio": game.audio.stats(),
+        "themes": game.themes.stats()
+    }
+    game.assets.shutdown()
+    game.store.close()
+    save_dir.cleanup()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless render and game-logic benchmarks for the memory game")
+    parser.add_argument("--resolutions", default="1080p,1440p,4k", help="comma separated names (720p, 1080p, 1440p, 4k) or WxH")
+    parser.add_argument("--levels", type=int, default=len(BOARD_SIZES),
+                        help="scripted levels per resolution, from level 1; each level has a larger board")
+    parser.add_argument("--frames", type=int, default=300, help="frames per draw scenario per level")
+    parser.add_argument("--canvas", help="draw at this WxH and scale to each resolution (see MONGOGAME_CANVAS)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cache-dir", help="asset cache directory; defaults to a fresh one per run so startup is cold")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        run_child(args)
+        return
+    
+    # One process per resolution so startup time and peak RSS are measured independently
+    results = []
+    for name in args.resolutions.split(","):
+        name = name.strip()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            command = [sys.executable, os.path.abspath(__file__), "--child", name,
+                       "--levels", str(args.levels), "--frames", str(args.frames),
+                       "--seed", str(args.seed), "--cache-dir", args.cache_dir or cache_dir]
+            if args.canvas:
+                command += ["--canvas", args.canvas]
+            completed = subprocess.run(command, capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0:
+            print(f"Benchmark failed for {name}:\n{completed.stderr}", file=sys.stderr)
+            results.append({"resolution": name, "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    
+    import pygame
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "seed": args.seed,
+        "canvas": args.canvas,
+        "levels": args.levels,
+        "frames": args.frames,
+        "results": results
+    }
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import struct
+import time
+import zlib
+
+import pygame
+
+import mongogame
+import telemetry
+
+# Wire format: every message is a 4-byte little-endian payload length, a 1-byte kind, then the payload.
+# Client to host: b"H" hello (JSON {"player": name}), b"M" mouse press and b"K" key press (payloads as in
+# the input log), b"B" bye. Host to client: b"W" welcome (JSON session, width, height), b"R" a repainted
+# rect (x, y, w, h, then zlib-compressed RGB), b"P" present (frame number), b"S" sound cue (name),
+# b"E" session ended (reason).
+HEADER = struct.Struct("<IB")
+RECT = struct.Struct("<HHHH")
+PRESENT = struct.Struct("<I")
+DEFAULT_PORT = 8765
+# Client messages are a hello or a single press; anything larger is a broken or hostile client
+CLIENT_PAYLOAD_LIMIT = 4096
+
+
+def pack(kind, payload=b""):
+    return HEADER.pack(len(payload), kind[0]) + payload
+
+
+async def read_message(reader, limit=None):
+    length, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if limit is not None and length > limit:
+        raise ValueError(f"message of {length} bytes is over the {limit} byte limit")
+    return bytes([kind]), await reader.readexactly(length)
+
+
+class KioskSession(mongogame.MemoryGame):
+    # One player's board, score and timers on an offscreen surface. Built from the host's game object,
+    # so decoded images, fonts, text and surface caches and the save store are shared, never copied.
+    @classmethod
+    def fork(cls, template, player, seed, writer):
+        session = cls.__new__(cls)
+        session.__dict__.update(template.__dict__)
+        session.screen = pygame.Surface((template.SCREEN_WIDTH, template.SCREEN_HEIGHT))
+        session.view = None
+        session.seed = seed
+        session.rng = random.Random(seed)
+        session.player = player
+        session.writer = writer
+        session.frame_number = 0
+        # Each board reports under its own telemetry session. The host paces and feeds sessions
+        # itself, so they have no input log or frame scheduler of their own.
+        session.telemetry = telemetry.Telemetry(template.telemetry.directory if template.telemetry.writer else None,
+                                                f"{time.strftime('%Y%m%d-%H%M%S')}-{seed:016x}")
+        session.input = None
+        session.scheduler = None
+        session.init_session_state()
+        # Only repainted rects go over the wire
+        session.dirty_rendering = True
+        return session
+
+    def set_theme(self, name):
+        # The host keeps every theme decoded for all sessions, so nothing is discarded here
+        self.theme = name
+        self.background_images.prefetch([name])
+
+    def prefetch_level_sounds(self, names):
+        # Nothing to decode here; the display end plays its own sounds
+        pass
+
+    def play_sound(self, name):
+        # Sounds play on the display end
+        self.writer.write(pack(b"S", name.encode("utf-8")))
+
+    def present(self):
+        bounds = self.screen.get_rect()
+        for rect in self.dirty_rects:
+            rect = rect.clip(bounds)
+            if rect.width and rect.height:
+                pixels = pygame.image.tostring(self.screen.subsurface(rect), "RGB")
+                self.writer.write(pack(b"R", RECT.pack(*rect) + zlib.compress(pixels, 1)))
+        self.dirty_rects = []
+        self.frame_number += 1
+        self.writer.write(pack(b"P", PRESENT.pack(self.frame_number)))
+
+    def quit(self):
+        # Quit events never come from clients; a session can't stop the host
+        self.game_over = True
+
+
+class KioskHost:
+    # Runs every session in one asyncio loop. Each session sleeps until input arrives or its next
+    # frame is due, just like the single-display game loop, so idle boards cost almost nothing.
+    FPS = 60
+    IDLE_MAX_MS = 1000
+
+    def __init__(self, template, max_sessions):
+        self.template = template
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.next_id = 1
+
+    async def handle(self, reader, writer):
+        try:
+            kind, payload = await read_message(reader, CLIENT_PAYLOAD_LIMIT)
+            hello = json.loads(payload) if kind == b"H" else {}
+            if not isinstance(hello, dict):
+                raise ValueError("hello is not a JSON object")
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            writer.close()
+            return
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(pack(b"E", b"host full"))
+            await writer.drain()
+            writer.close()
+            return
+
+        session_id = self.next_id
+        self.next_id += 1
+        player = str(hello.get("player") or f"kiosk-{session_id}")
+        session = KioskSession.fork(self.template, player, random.getrandbits(63), writer)
+        self.sessions[session_id] = session
+        writer.write(pack(b"W", json.dumps({"session": session_id, "width": session.SCREEN_WIDTH,
+                                            "height": session.SCREEN_HEIGHT}).encode("utf-8")))
+        print(f"Session {session_id} started for {player} ({len(self.sessions)} active)")
+
+        events = []
+        wake = asyncio.Event()
+        input_task = asyncio.create_task(self.read_input(reader, events, wake))
+        try:
+            await self.run_session(session, events, wake, input_task)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            input_task.cancel()
+            session.save_game()
+            session.telemetry.close()
+            del self.sessions[session_id]
+            writer.close()
+            print(f"Session {session_id} ended ({len(self.sessions)} active)")
+
+    async def close(self, timeout=5):
+        # Hang up on every client; each session's handler saves its progress on the way out
+        for session in list(self.sessions.values()):
+            session.writer.close()
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.sessions and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def read_input(self, reader, events, wake):
+        try:
+            while True:
+                kind, payload = await read_message(reader, CLIENT_PAYLOAD_LIMIT)
+                if kind == b"M":
+                    x, y, button = mongogame.InputRecorder.MOUSE.unpack(payload)
+                    events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=button))
+                elif kind == b"K":
+                    key, = mongogame.InputRecorder.KEY.unpack(payload)
+                    events.append(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode=""))
+                elif kind == b"B":
+                    break
+                wake.set()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, struct.error):
+            pass
+        wake.set()
+
+    async def run_session(self, session, events, wake, input_task):
+        loop = asyncio.get_running_loop()
+        session.begin_play()
+        last = loop.time()
+        dt = 0
+        while True:
+            # Same frame order as the game loop: drain input, simulate, apply input, render
+            pending = events[:]
+            events.clear()
+            if session.play_frame(dt, pending) or session.game_over:
+                # Kiosks have no menu; the back button or a game over starts a fresh board
+                session.animations.clear()
+                session.begin_play()
+            await session.writer.drain()
+            if input_task.done():
+                return
+
+            # Sleep until input or the next timer, never faster than FPS
+            due = session.next_frame_due()
+            timeout = self.IDLE_MAX_MS if due is None else min(due, self.IDLE_MAX_MS)
+            if timeout > 1000 // self.FPS:
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            wake.clear()
+            remaining = last + 1 / self.FPS - loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+            now = loop.time()
+            dt = int((now - last) * 1000)
+            last += dt / 1000
+
+
+def warm_caches(game):
+    # Decode every background and face up front; sessions only ever read them
+    game.background_images.prefetch()
+    game.loaded_images.prefetch()
+    for group in (game.background_images, game.loaded_images):
+        for name in group.keys():
+            group[name]
+
+
+async def serve(args):
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    # SDL would turn SIGTERM into a quit event that nothing here reads; the host handles signals itself
+    os.environ["SDL_NO_SIGNAL_HANDLERS"] = "1"
+    mongogame.MemoryGame.INPUT_LOG = ""
+    mongogame.MemoryGame.FRAME_STATS_LOG = ""
+    width, height = (int(v) for v in args.resolution.split("x"))
+    template = mongogame.MemoryGame(resolution=(width, height), fullscreen=False)
+
+    start = time.perf_counter()
+    warm_caches(template)
+    print(f"Assets ready in {time.perf_counter() - start:.1f}s")
+
+    host = KioskHost(template, args.max_sessions)
+    server = await asyncio.start_server(host.handle, args.host, args.port)
+    print(f"Serving {width}x{height} sessions on {args.host}:{args.port}")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows event loops have no signal handlers; Ctrl+C still raises KeyboardInterrupt
+            pass
+    try:
+        async with server:
+            await stop.wait()
+            print("Shutting down")
+            server.close()
+            await host.close()
+    finally:
+        template.store.close()
+        template.telemetry.close()
+
+
+async def run_client(args, index):
+    # Stand-in for a thin display: shows what the host sends and forwards clicks and key presses.
+    # With --bot it runs headless and taps random spots instead.
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    player = f"{args.player}-{index}" if args.count > 1 else args.player
+    writer.write(pack(b"H", json.dumps({"player": player}).encode("utf-8")))
+    kind, payload = await read_message(reader)
+    if kind != b"W":
+        print(f"Client {index}: {payload.decode('utf-8', 'replace')}")
+        writer.close()
+        return None
+    welcome = json.loads(payload)
+    size = (welcome["width"], welcome["height"])
+    display = pygame.display.set_mode(size) if not args.bot else None
+    canvas = display or pygame.Surface(size)
+    stats = {"frames": 0, "rects": 0, "bytes": 0, "sounds": 0}
+
+    async def receive():
+        while True:
+            kind, payload = await read_message(reader)
+            stats["bytes"] += HEADER.size + len(payload)
+            if kind == b"R":
+                x, y, w, h = RECT.unpack_from(payload)
+                pixels = zlib.decompress(payload[RECT.size:])
+                canvas.blit(pygame.image.fromstring(pixels, (w, h), "RGB"), (x, y))
+                stats["rects"] += 1
+            elif kind == b"P":
+                stats["frames"] += 1
+                if display:
+                    pygame.display.flip()
+            elif kind == b"S":
+                stats["sounds"] += 1
+            elif kind == b"E":
+                return
+
+    receiver = asyncio.create_task(receive())
+    rng = random.Random(index)
+    start = time.perf_counter()
+    try:
+        while not receiver.done():
+            if args.bot:
+                if time.perf_counter() - start >= args.bot:
+                    break
+                await asyncio.sleep(rng.uniform(0.2, 0.8))
+                pos = (rng.randrange(size[0]), rng.randrange(size[1]))
+                writer.write(pack(b"M", mongogame.InputRecorder.MOUSE.pack(*pos, 1)))
+            else:
+                await asyncio.sleep(1 / 60)
+                for e in pygame.event.get():
+                    if e.type == pygame.QUIT:
+                        receiver.cancel()
+                    elif e.type == pygame.MOUSEBUTTONDOWN:
+                        writer.write(pack(b"M", mongogame.InputRecorder.MOUSE.pack(*e.pos, e.button)))
+                    elif e.type == pygame.KEYDOWN:
+                        writer.write(pack(b"K", mongogame.InputRecorder.KEY.pack(e.key)))
+            await writer.drain()
+        writer.write(pack(b"B"))
+        await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    receiver.cancel()
+    writer.close()
+    stats["seconds"] = round(time.perf_counter() - start, 1)
+    return stats
+
+
+async def clients(args):
+    if args.bot:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()
+    results = await asyncio.gather(*(run_client(args, index) for index in range(args.count)))
+    for index, stats in enumerate(results):
+        if stats:
+            print(f"Client {index}: {stats['frames']} frames, {stats['rects']} rects, "
+                  f"{stats['bytes'] / 1024:.0f} KiB, {stats['sounds']} sounds in {stats['seconds']}s")
+    pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many memory game sessions for thin kiosk displays")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server = commands.add_parser("serve", help="run the session host")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    server.add_argument("--resolution", default="1280x720", help="display size shared by every session")
+    server.add_argument("--max-sessions", type=int, default=16)
+    client = commands.add_parser("client", help="stand-in display for testing a host")
+    client.add_argument("--host", default="127.0.0.1")
+    client.add_argument("--port", type=int, default=DEFAULT_PORT)
+    client.add_argument("--player", default="kiosk")
+    client.add_argument("--bot", type=float, help="tap randomly for this many seconds without a window")
+    client.add_argument("--count", type=int, default=1, help="concurrent clients (with --bot)")
+    args = parser.parse_args()
+
+    if args.command == "client" and args.count > 1 and not args.bot:
+        parser.error("--count needs --bot")
+    try:
+        asyncio.run(serve(args) if args.command == "serve" else clients(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
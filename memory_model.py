@@ -0,0 +1,132 @@
+from array import array
+
+# Tile state bits
+REVEALED = 1
+FOUND = 2
+
+# Results of resolving a selected pair
+MATCH = 1
+MISMATCH = 2
+MISMATCH_LIMIT = 3  # third mistake in a row; the streak starts over
+
+# Level progression shared by the game and the batch simulator
+BOARD_SIZES = [(4, 4), (4, 4), (5, 4), (6, 4), (6, 5), (6, 6), (8, 6), (8, 7), (8, 8),
+               (10, 8), (10, 10), (12, 10), (12, 12)]
+TIME_LIMITS = [30, 60, 90, 120]
+
+
+def board_size(level):
+    cols, rows = BOARD_SIZES[min(level, len(BOARD_SIZES)) - 1]
+    if cols * rows % 2:
+        rows += 1
+    return cols, rows
+
+
+def level_pair_ids(pair_count, image_count):
+    # Animals repeat when a board has more pairs than there are images
+    return [i % image_count for i in range(pair_count)] * 2
+
+
+class GameModel:
+    # Render-free game rules: the board is two flat arrays indexed by row * cols + col
+    MATCH_POINTS = 7
+    MISTAKE_LIMIT = 3
+    
+    def __init__(self, score=0, level=1, tries=3):
+        self.score = score
+        self.level = level
+        self.tries = tries
+        self.new_level(0, 0, [], 0)
+    
+    def new_level(self, cols, rows, pair_ids, time_limit):
+        self.cols = cols
+        self.rows = rows
+        self.pairs = array("H", pair_ids)
+        self.state = array("B", bytes(len(self.pairs)))
+        self.pair_count = len(self.pairs) // 2
+        self.matched = 0
+        self.first = -1
+        self.second = -1
+        self.consecutive_mistakes = 0
+        self.mistakes = 0
+        self.time_limit_ms = time_limit * 1000
+        self.elapsed_ms = 0
+    
+    def revealed(self, index):
+        return self.state[index] & REVEALED != 0
+    
+    def found(self, index):
+        return self.state[index] & FOUND != 0
+    
+    def reveal_all(self):
+        for index in range(len(self.state)):
+            self.state[index] |= REVEALED
+    
+    def hide_all(self):
+        for index in range(len(self.state)):
+            self.state[index] &= ~REVEALED
+    
+    def hide(self, *indices):
+        for index in indices:
+            self.state[index] &= ~REVEALED
+    
+    def flip(self, index):
+        # Returns True when the tile was turned over as part of the current pair
+        if self.second >= 0 or self.state[index]:
+            return False
+        self.state[index] |= REVEALED
+        if self.first < 0:
+            self.first = index
+        else:
+            self.second = index
+        return True
+    
+    @property
+    def pair_ready(self):
+        return self.second >= 0
+    
+    def resolve(self):
+        # Settle the selected pair; mismatched tiles stay revealed until hide() is called
+        first, second = self.first, self.second
+        self.first = self.second = -1
+        
+        if self.pairs[first] == self.pairs[second]:
+            self.state[first] |= FOUND
+            self.state[second] |= FOUND
+            self.score += self.MATCH_POINTS
+            self.matched += 1
+            self.consecutive_mistakes = 0
+            return MATCH, first, second
+        
+        self.mistakes += 1
+        self.consecutive_mistakes += 1
+        if self.consecutive_mistakes == self.MISTAKE_LIMIT:
+            self.consecutive_mistakes = 0
+            return MISMATCH_LIMIT, first, second
+        return MISMATCH, first, second
+    
+    @property
+    def complete(self):
+        return self.pair_count > 0 and self.matched == self.pair_count
+    
+    def tick(self, ms):
+        # Returns True on the tick the level runs out of time
+        if self.complete or self.elapsed_ms >= self.time_limit_ms:
+            return False
+        self.elapsed_ms += ms
+        return self.elapsed_ms // 1000 >= self.time_limit_ms // 1000
+    
+    @property
+    def elapsed_seconds(self):
+        return self.elapsed_ms // 1000
+    
+    @property
+    def time_left(self):
+        return max(0, self.time_limit_ms // 1000 - self.elapsed_seconds)
+    
+    def lose_try(self):
+        self.tries -= 1
+        return self.tries
+    
+    def complete_level(self):
+        self.level += 1
@@ -1,9 +1,28 @@
 import pygame
 import random
 import sys
-import time
 import os
+import time
+import csv
+import json
+import platform
+import math
+import glob
+import hashlib
+import mmap
+import io
+import threading
+import queue
+import sqlite3
+import atexit
+import struct
+import tempfile
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from PIL import Image
+from memory_model import GameModel, MATCH, MISMATCH_LIMIT, TIME_LIMITS, board_size, level_pair_ids
+import telemetry
 
 class MemoryGame:
     # Constants
@@ -16,35 +35,174 @@ class MemoryGame:
     BUTTON_COLOR = (50, 50, 50)
     HOVER_COLOR = (100, 100, 100)
     BUTTON_RADIUS = 15
+    # Set MONGOGAME_RENDER=full to fall back to redrawing the whole screen every frame
+    DIRTY_RECTS = os.environ.get("MONGOGAME_RENDER", "dirty") != "full"
+    TEXT_CACHE_SIZE = 256
+    REVEAL_MS = 2000
+    ASSET_WORKERS = 4
+    # Set MONGOGAME_ASSET_PROCESSES=1 to run PIL decoding in worker processes
+    ASSET_PROCESSES = os.environ.get("MONGOGAME_ASSET_PROCESSES") == "1"
+    ASSET_CACHE_DIR = os.environ.get("MONGOGAME_CACHE_DIR", ".asset_cache")
+    BACKGROUND_OPACITY = 207
+    # Compressed background files kept in RAM; only the active theme and the next are decoded
+    THEME_ROOT = "assets/background_img"
+    THEME_BUDGET_BYTES = int(os.environ.get("MONGOGAME_THEME_BUDGET_MB", "16")) * 1024 * 1024
+    # Set MONGOGAME_PROFILE=1 or pass --profile to time each frame phase
+    PROFILE = os.environ.get("MONGOGAME_PROFILE") == "1"
+    PROFILE_TRACE = os.environ.get("MONGOGAME_PROFILE_TRACE")
+    AUDIO_BUDGET_BYTES = 8 * 1024 * 1024
+    AUDIO_STREAM_BYTES = 150000  # compressed size above which a clip is decoded per level, outside the cache
+    # Board grows with the level (see memory_model.BOARD_SIZES); MONGOGAME_BOARD=COLSxROWS forces a size
+    BOARD_OVERRIDE = os.environ.get("MONGOGAME_BOARD")
+    HUD_MARGIN_TOP = 80
+    HUD_MARGIN_BOTTOM = 100
+    # Per-level time limits produced by simulate.py; random limits are used without it
+    DIFFICULTY_TABLE = os.environ.get("MONGOGAME_DIFFICULTY", "difficulty.json")
+    # Progress for every player profile; game_save.txt from older versions is imported once
+    SAVE_DB = os.environ.get("MONGOGAME_SAVE", "game_save.db")
+    LEGACY_SAVE = "game_save.txt"
+    # Set MONGOGAME_PLAYER or pass --player NAME to pick or create a profile; defaults to the last one played
+    PLAYER = os.environ.get("MONGOGAME_PLAYER")
+    # Gameplay events are flushed here as gzipped JSONL (summarize with telemetry.py); set it empty to disable
+    TELEMETRY_DIR = os.environ.get("MONGOGAME_TELEMETRY_DIR", "telemetry")
+    # Every session's input is logged here for replay (python mongogame.py --replay FILE); set it empty to disable
+    INPUT_LOG = os.environ.get("MONGOGAME_INPUT_LOG", "last_session.mglog")
+    # Set MONGOGAME_SEED or pass --seed N to fix the session's random sequence
+    SEED = int(os.environ["MONGOGAME_SEED"]) if os.environ.get("MONGOGAME_SEED") else None
+    # Set MONGOGAME_IDLE_FRAMES=0 to render at full rate even when nothing changes (e.g. while profiling)
+    IDLE_FRAMES = os.environ.get("MONGOGAME_IDLE_FRAMES", "1") != "0"
+    # Per-minute frame rate, duty cycle, CPU and input latency are appended here as JSON lines; set it empty to disable
+    FRAME_STATS_LOG = os.environ.get("MONGOGAME_FRAME_STATS", "frame_stats.jsonl")
+    # Set MONGOGAME_CANVAS=WIDTHxHEIGHT (e.g. 1920x1080) or pass --canvas to draw every frame at that size
+    # and have the display scale it up to the panel; leave it empty to draw at the panel's own size
+    CANVAS = os.environ.get("MONGOGAME_CANVAS", "")
     
-    def __init__(self):
+    def __init__(self, profile=None, resolution=None, fullscreen=True, seed=None, input_log=None,
+                 save_path=None, player=None, canvas=None):
         pygame.init()
         pygame.mixer.init()
+        self.profiler = FrameProfiler(self.PROFILE if profile is None else profile, self.PROFILE_TRACE)
         
-        # Screen setup
-        info = pygame.display.Info()
-        self.SCREEN_WIDTH, self.SCREEN_HEIGHT = info.current_w, info.current_h
-        self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT), pygame.FULLSCREEN)
+        # All gameplay randomness comes from one seeded generator so a session can be replayed
+        self.seed = self.SEED if seed is None else seed
+        if self.seed is None:
+            self.seed = int.from_bytes(os.urandom(8), "little") >> 1
+        # Input logs store the seed as 64 unsigned bits; negative or huge seeds fold into that range
+        self.seed %= 2 ** 63
+        self.rng = random.Random(self.seed)
+        self.profiler.session["seed"] = self.seed
+        
+        # Replays re-run old input, so they don't add telemetry
+        self.telemetry = telemetry.Telemetry(None if input_log else self.TELEMETRY_DIR,
+                                             f"{time.strftime('%Y%m%d-%H%M%S')}-{self.seed:016x}")
+        
+        # Screen setup, native fullscreen unless a resolution is given (e.g. for benchmarks)
+        if resolution:
+            self.SCREEN_WIDTH, self.SCREEN_HEIGHT = resolution
+        else:
+            info = pygame.display.Info()
+            self.SCREEN_WIDTH, self.SCREEN_HEIGHT = info.current_w, info.current_h
+        self.display_size = (self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+        flags = pygame.FULLSCREEN if fullscreen else 0
+        canvas = canvas_size(self.CANVAS if canvas is None else canvas)
+        self.screen = None
+        self.view = None
+        if canvas and canvas != self.display_size and fullscreen:
+            # Layout, caches and every blit use the canvas size. SDL letterboxes and scales the canvas to
+            # the panel once per flip and maps mouse positions back, so frame cost follows the canvas.
+            os.environ.setdefault("SDL_RENDER_SCALE_QUALITY", "linear")
+            try:
+                self.screen = pygame.display.set_mode(canvas, flags | pygame.SCALED)
+            except pygame.error as e:
+                print(f"Error setting up {canvas[0]}x{canvas[1]} canvas, drawing at display size: {e}")
+        elif canvas and canvas != self.display_size:
+            # SDL sizes a scaled window by itself, so windows of a requested size (e.g. benchmarks)
+            # scale the canvas into the window here instead
+            self.view = CanvasView(pygame.display.set_mode(self.display_size, flags), canvas)
+            self.screen = self.view.canvas
+        if self.screen is None:
+            self.screen = pygame.display.set_mode(self.display_size, flags)
+        else:
+            self.SCREEN_WIDTH, self.SCREEN_HEIGHT = canvas
+            self.profiler.session["display"] = f"{self.display_size[0]}x{self.display_size[1]}"
         pygame.display.set_caption("Memory Game")
         
-        # Load fonts
+        # Load fonts and tuning data
         self.load_fonts()
+        self.load_difficulty()
+        self.text_cache = TextCache(self.TEXT_CACHE_SIZE)
         
         # Load assets
+        self.assets = AssetManager(self.ASSET_WORKERS, self.ASSET_PROCESSES)
+        self.disk_cache = SurfaceDiskCache(self.ASSET_CACHE_DIR)
+        self.surfaces = SurfaceRegistry()
+        self.profiler.session["resolution"] = f"{self.SCREEN_WIDTH}x{self.SCREEN_HEIGHT}"
         self.load_backgrounds()
         self.load_tile_images()
         self.load_sounds()
         
         # Game state
+        self.clock = pygame.time.Clock()
+        # Replays run faster than real time, so their frame stats would mean nothing
+        self.scheduler = FrameScheduler(self.IDLE_FRAMES, None if input_log else self.FRAME_STATS_LOG,
+                                        verbose=self.profiler.enabled)
+        self.init_session_state()
+        
+        # Frame timing and input go through the recorder (or a replay) instead of the clock and event queue
+        self.store = SaveStore(save_path or self.SAVE_DB, None if save_path else self.LEGACY_SAVE)
+        self.player = player or self.PLAYER or (self.store.players() or ["default"])[0]
+        self.load_game()
+        self.input = input_log or InputRecorder(self.clock, self.INPUT_LOG, self.seed,
+                                                (self.SCREEN_WIDTH, self.SCREEN_HEIGHT),
+                                                (self.score, self.level, self.energy), self.view)
+        
+    def init_session_state(self):
+        # One player's board, timers and render state; kiosk sessions share everything else
         self.current_background = None
+        self.theme = self.rng.choice(self.background_images.keys())
+        self.theme_level = None
         self.active_tiles = []
         self.start_x = 0
         self.start_y = 0
-        self.score = 0
-        self.level = 1
+        self.cols, self.rows = 4, 4
+        self.tile_size = self.TILE_SIZE
+        self.padding = self.PADDING
+        self.atlas = None
+        self.frame_cache = AnimationFrameCache(Tile.CELEBRATE_SCALES)
+        self.model = GameModel()
         self.energy = 3
-        self.clock = pygame.time.Clock()
+        self.animations = AnimationScheduler()
+        self.phase = "play"
+        self.overlay_text = None
+        self.overlay_rect = None
+        self.game_over = False
+        self.last_flip_ms = 0
+        self.pair_started_ms = 0
         
+        # Dirty-rect rendering state
+        self.dirty_rendering = self.DIRTY_RECTS
+        self.dirty_rects = []
+        self.transient_rects = []
+        self.hud_slots = {}
+        self.full_redraw = True
+    
+    # Score and level live in the game model; these keep save/load and the menu unchanged
+    @property
+    def score(self):
+        return self.model.score
+    
+    @score.setter
+    def score(self, value):
+        self.model.score = value
+    
+    @property
+    def level(self):
+        return self.model.level
+    
+    @level.setter
+    def level(self, value):
+        self.model.level = value
+    
     def load_fonts(self):
         try:
             self.georgian_font = pygame.font.Font("assets/fonts/ARIALUNI.ttf", self.FONT_SIZE)
@@ -52,32 +210,67 @@ class MemoryGame:
             print("Error loading Georgian font. Using system font instead.")
             self.georgian_font = pygame.font.SysFont("Arial", self.FONT_SIZE)
     
+    def load_difficulty(self):
+        self.time_limits = {}
+        try:
+            with open(self.DIFFICULTY_TABLE, "r") as f:
+                table = json.load(f)
+            self.time_limits = {int(level): entry["time_limit"] for level, entry in table["levels"].items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error loading difficulty table {self.DIFFICULTY_TABLE}: {e}")
+    
+    def time_limit_for(self, level):
+        if not self.time_limits:
+            return self.rng.choice(TIME_LIMITS)
+        # Levels past the end of the table keep the last level's limit
+        return self.time_limits.get(level, self.time_limits[max(self.time_limits)])
+    
     def load_backgrounds(self):
-        self.background_images = []
-        for i in range(1, 5):
-            path = f"assets/background_img/bg{i}.jpg"
-            if os.path.exists(path):
-                self.background_images.append(
-                    pygame.transform.scale(
-                        self.load_jpg(path), 
-                        (self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
-                    )
-                )
+        self.themes = ThemeLibrary(self.THEME_ROOT, self.THEME_BUDGET_BYTES)
+        
+        def load_background(name):
+            if name is None:
+                # Create a fallback background if images not found
+                return self.surfaces.overlay("fallback_background", (self.SCREEN_WIDTH, self.SCREEN_HEIGHT), (30, 30, 80), alpha=False)
+            
+            path = self.themes.paths[name]
+            size = (self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+            cached = self.disk_cache.load(path, size, self.BACKGROUND_OPACITY)
+            if cached is not None:
+                return cached
+            bg = pygame.transform.scale(self.load_jpg(self.themes.data(name), self.BACKGROUND_OPACITY, path), size)
+            self.disk_cache.store(path, size, self.BACKGROUND_OPACITY, bg)
+            return bg
         
-        if not self.background_images:
-            # Create a fallback background if images not found
-            bg = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
-            bg.fill((30, 30, 80))
-            self.background_images = [bg]
+        sources = {name: name for name in self.themes.names()} or {"fallback": None}
+        
+        # Backgrounds decode on worker threads when their theme comes up (see set_theme)
+        # Backgrounds are flattened onto black once so every blit is an opaque copy
+        self.background_images = self.assets.group(load_background, sources, self.surfaces.adopt_opaque)
+    
+    def set_theme(self, name):
+        # Keep only the active theme and the one after it decoded; the rest stay compressed
+        self.theme = name
+        upcoming = [name]
+        if name in self.themes.paths:
+            upcoming.append(self.themes.next_after(name))
+        for other in self.background_images.keys():
+            if other not in upcoming:
+                self.background_images.discard(other)
+        self.background_images.prefetch(upcoming)
+    
+    def theme_label(self):
+        return self.themes.label(self.theme) if self.theme in self.themes.paths else self.theme
     
-    def load_jpg(self, path, opacity=207):
+    def load_jpg(self, source, opacity=207, path=None):
+        # source is a file path or the file's bytes
         try:
-            img = Image.open(path).convert("RGBA")
-            alpha = img.getchannel("A").point(lambda p: opacity)
-            img.putalpha(alpha)
-            return pygame.image.fromstring(img.tobytes(), img.size, img.mode)
+            data, size, mode = self.assets.decode(decode_jpg, source, opacity)
+            return pygame.image.fromstring(data, size, mode)
         except Exception as e:
-            print(f"Error loading image {path}: {e}")
+            print(f"Error loading image {path or source}: {e}")
             # Return a placeholder surface
             surface = pygame.Surface((100, 100), pygame.SRCALPHA)
             surface.fill((200, 0, 200, opacity))
@@ -93,346 +286,641 @@ class MemoryGame:
         }
         
         self.back_image_name = "A.png"
-        self.loaded_images = {}
         
-        # Load all images with error handling
-        for name in list(self.image_names.keys()) + [self.back_image_name]:
-            path = f"assets/animals_wallpaper/{name}"
+        # Load images with error handling
+        def load_tile_image(path):
+            size = (self.TILE_SIZE, self.TILE_SIZE)
+            cached = self.disk_cache.load(path, size)
+            if cached is not None:
+                return cached
             try:
-                self.loaded_images[name] = pygame.transform.scale(
+                surface = pygame.transform.scale(
                     pygame.image.load(path), 
-                    (self.TILE_SIZE, self.TILE_SIZE)
+                    size
                 )
+                self.disk_cache.store(path, size, None, surface)
+                return surface
             except:
                 print(f"Error loading image: {path}")
                 # Create a placeholder image
-                surface = pygame.Surface((self.TILE_SIZE, self.TILE_SIZE), pygame.SRCALPHA)
-                surface.fill((random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)))
-                pygame.draw.rect(surface, (0, 0, 0), surface.get_rect(), 2)
-                self.loaded_images[name] = surface
+                def outline(surface):
+                    pygame.draw.rect(surface, (0, 0, 0), surface.get_rect(), 2)
+                color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+                return self.surfaces.overlay(("placeholder", path), (self.TILE_SIZE, self.TILE_SIZE), color, outline)
+        
+        # Tile faces stream in when a level first needs them
+        paths = {name: f"assets/animals_wallpaper/{name}" for name in list(self.image_names.keys()) + [self.back_image_name]}
+        self.loaded_images = self.assets.group(load_tile_image, paths, self.surfaces.adopt)
+        self.loaded_images.prefetch([self.back_image_name])
     
     def load_sounds(self):
-        # Helper function to safely load sounds
-        def load_sound(path):
-            try:
-                return pygame.mixer.Sound(path)
-            except:
-                print(f"Error loading sound: {path}")
-                # Return a silent sound
-                return pygame.mixer.Sound(buffer=bytes([0]*44))
+        self.audio = AudioEngine(self.assets, self.AUDIO_BUDGET_BYTES, self.AUDIO_STREAM_BYTES)
         
-        # Background music
+        # Background music rotates through every track without gaps
         self.background_music_tracks = [
             "assets/background_music/background_music1.mp3",
             "assets/background_music/background_music2.mp3",
             "assets/background_music/background_music3.mp3"
         ]
+        self.audio.start_music(self.background_music_tracks)
         
-        # Try to play background music
-        try:
-            track = random.choice(self.background_music_tracks)
-            if os.path.exists(track):
-                pygame.mixer.music.load(track)
-                pygame.mixer.music.play(-1)
-        except Exception as e:
-            print(f"Error playing background music: {e}")
+        # Game and win sounds decode in the background right away
+        self.audio.register("button_click", "assets/menu_click/click.mp3", "ui")
+        self.audio.register("click", "assets/choice_audio/click.mp3", "feedback")
+        self.audio.register("good", "assets/choice_audio/good_choice.mp3", "feedback")
+        self.audio.register("lose", "assets/winlose_audio/lose.mp3", "feedback")
+        self.win_sounds = ["win", "win2", "win3"]
+        self.audio.register("win", "assets/winlose_audio/win.mp3", "feedback")
+        self.audio.register("win2", "assets/winlose_audio/win2.mp3", "feedback")
+        self.audio.register("win3", "assets/winlose_audio/win3.mp3", "feedback")
+        self.audio.prefetch(["button_click", "click", "good", "lose"] + self.win_sounds)
         
-        # Game sounds
-        self.click_sound = load_sound("assets/choice_audio/click.mp3")
-        self.good_sound = load_sound("assets/choice_audio/good_choice.mp3")
-        self.button_click_sound = load_sound("assets/menu_click/click.mp3")
-        self.lose_sound = load_sound("assets/winlose_audio/lose.mp3")
-        
-        # Win sounds
-        self.win_sounds = [
-            load_sound("assets/winlose_audio/win.mp3"),
-            load_sound("assets/winlose_audio/win2.mp3"),
-            load_sound("assets/winlose_audio/win3.mp3")
-        ]
-        
-        # Animal sounds
+        # Animal sounds load when a level with that animal starts
         self.animal_sounds = {
-            "1.png": load_sound("assets/animals_audio/monkey.mp3"),
-            "4.png": load_sound("assets/animals_audio/frog.mp3"),
-            "5.png": load_sound("assets/animals_audio/lion.mp3"),
-            "9.png": load_sound("assets/animals_audio/parrot.mp3"),
-            "12.png": load_sound("assets/animals_audio/wolf.mp3"),
-            "17.png": load_sound("assets/animals_audio/redsqurrel.mp3"),
-            "18.png": load_sound("assets/animals_audio/sloth.mp3"),
-            "19.png": load_sound("assets/animals_audio/owl.mp3"),
-            "20.png": load_sound("assets/animals_audio/bear.mp3"),
-            "21.png": load_sound("assets/animals_audio/snake.mp3")
+            "1.png": "assets/animals_audio/monkey.mp3",
+            "4.png": "assets/animals_audio/frog.mp3",
+            "5.png": "assets/animals_audio/lion.mp3",
+            "9.png": "assets/animals_audio/parrot.mp3",
+            "12.png": "assets/animals_audio/wolf.mp3",
+            "17.png": "assets/animals_audio/redsqurrel.mp3",
+            "18.png": "assets/animals_audio/sloth.mp3",
+            "19.png": "assets/animals_audio/owl.mp3",
+            "20.png": "assets/animals_audio/bear.mp3",
+            "21.png": "assets/animals_audio/snake.mp3"
         }
+        for name, path in self.animal_sounds.items():
+            self.audio.register(name, path, "animal")
+    
+    def wait_for(self, group, name):
+        # Show load progress until a specific asset is ready
+        group.prefetch([name])
+        while not group.ready(name):
+            for e in pygame.event.get():
+                self.audio.handle_event(e)
+                if e.type == pygame.QUIT:
+                    self.quit()
+            done, total = self.assets.progress()
+            self.screen.fill((30, 30, 80))
+            self.display_text(f"იტვირთება... {done}/{total}", self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2)
+            self.invalidate()
+            self.flip_display()
+            self.clock.tick(30)
+        return group[name]
+    
+    def build_asset_cache(self):
+        # Decode every background and tile once so later launches map them straight from disk
+        self.background_images.prefetch()
+        self.loaded_images.prefetch()
+        for name in self.background_images.keys():
+            self.background_images[name]
+            self.background_images.discard(name)
+        for name in self.loaded_images.keys():
+            self.loaded_images[name]
+        print(f"Asset cache ready in {self.disk_cache.directory}")
+    
+    def prefetch_level_sounds(self, names):
+        self.audio.release_long(names)
+        self.audio.prefetch(names)
+    
+    def play_sound(self, name):
+        with self.profiler.phase("sound"):
+            self.audio.play(name)
+    
+    def next_frame_due(self):
+        # Milliseconds until the game needs another frame without input; 0 means run at full rate
+        due = self.animations.next_due()
+        if self.phase == "play":
+            # The countdown (and its warning blink) changes once per second
+            second = 1000 - self.model.elapsed_ms % 1000
+            due = second if due is None else min(due, second)
+        return due
+    
+    def draw_profiler_overlay(self):
+        rect = self.profiler.draw(self.screen)
+        if rect:
+            self.mark_dirty(rect)
+            if self.dirty_rendering:
+                self.transient_rects.append(rect)
+    
+    def quit(self):
+        status = self.input.close(self.score, self.level, self.model.tries)
+        self.store.close()
+        self.telemetry.close()
+        self.scheduler.close()
+        self.profiler.session["input_latency_ms"] = self.scheduler.latency.percentiles()
+        self.profiler.session["minutes"] = list(self.scheduler.minutes)
+        self.profiler.dump()
+        self.assets.shutdown()
+        pygame.quit()
+        sys.exit(status)
     
     def save_game(self):
-        try:
-            with open("game_save.txt", "w") as f:
-                f.write(f"{self.score}\n{self.level}\n{self.energy}")
-        except Exception as e:
-            print(f"Error saving game: {e}")
+        # Queued for the store's writer thread; returns immediately
+        self.store.save(self.player, self.score, self.level, self.energy)
     
     def load_game(self):
-        try:
-            with open("game_save.txt", "r") as f:
-                self.score = int(f.readline())
-                self.level = int(f.readline())
-                self.energy = int(f.readline())
-        except:
-            self.score, self.level, self.energy = 0, 1, 3
+        # Served from memory, the database is only read at startup
+        self.score, self.level, self.energy = self.store.load(self.player)
+    
+    def record_level(self, result):
+        self.store.record_level(self.player, self.level, result, self.model.elapsed_ms / 1000,
+                                self.model.mistakes, self.score)
     
     def reset_game(self):
         self.score, self.level, self.energy = 0, 1, 3
         self.save_game()
     
     def draw_table_background(self, cols, rows):
-        table_width = cols * self.TILE_SIZE + (cols - 1) * self.PADDING
-        table_height = rows * self.TILE_SIZE + (rows - 1) * self.PADDING
-        table_surface = pygame.Surface((table_width, table_height), pygame.SRCALPHA)
-        table_surface.fill((0, 0, 0, self.TABLE_OPACITY))
+        table_width = cols * self.tile_size + (cols - 1) * self.padding
+        table_height = rows * self.tile_size + (rows - 1) * self.padding
+        table_surface = self.surfaces.overlay("table", (table_width, table_height), (0, 0, 0, self.TABLE_OPACITY))
         self.screen.blit(table_surface, (self.start_x, self.start_y))
     
+    def invalidate(self):
+        # Force the next draw_tiles to repaint the whole screen
+        self.full_redraw = True
+        self.transient_rects = []
+        self.hud_slots = {}
+    
+    def mark_dirty(self, rect):
+        self.dirty_rects.append(pygame.Rect(rect))
+    
+    def restore_region(self, rect):
+        # Repaint background, table and any tiles under a damaged region
+        rect = pygame.Rect(rect).clip(self.screen.get_rect())
+        if rect.width == 0 or rect.height == 0:
+            return
+        self.screen.set_clip(rect)
+        self.screen.blit(self.current_background, rect, rect)
+        self.draw_table_background(self.cols, self.rows)
+        for tile in self.tiles_near(rect):
+            if tile.bounds().colliderect(rect) or (tile.drawn_rect and tile.drawn_rect.colliderect(rect)):
+                tile.draw(self.screen, self.atlas, self.frame_cache)
+        self.screen.set_clip(None)
+        self.mark_dirty(rect)
+    
+    def present(self):
+        if not self.dirty_rendering:
+            self.flip_display()
+        elif self.dirty_rects and self.view is not None:
+            self.view.present(self.dirty_rects)
+        elif self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+        self.dirty_rects = []
+    
+    def flip_display(self):
+        # A full flip shows everything drawn so far, so no rect is still pending
+        if self.view is not None:
+            self.view.present()
+        else:
+            pygame.display.flip()
+        self.dirty_rects = []
+    
+    def mouse_pos(self):
+        pos = pygame.mouse.get_pos()
+        return self.view.to_canvas(pos) if self.view is not None else pos
+    
     def draw_tiles(self):
-        self.screen.blit(self.current_background, (0, 0))
-        self.draw_table_background(4, 4)
+        if self.full_redraw or not self.dirty_rendering:
+            self.screen.blit(self.current_background, (0, 0))
+            self.draw_table_background(self.cols, self.rows)
+            for tile in self.active_tiles:
+                tile.draw(self.screen, self.atlas, self.frame_cache)
+            self.invalidate()
+            self.full_redraw = False
+            self.mark_dirty(self.screen.get_rect())
+            return
+        
+        # Only repaint what changed since the last frame
+        damaged = self.transient_rects
+        self.transient_rects = []
         for tile in self.active_tiles:
-            tile.draw(self.screen, self.loaded_images)
+            if tile.needs_redraw():
+                if tile.drawn_rect:
+                    damaged.append(tile.drawn_rect)
+                damaged.append(tile.bounds())
+        for rect in damaged:
+            self.restore_region(rect)
     
-    def display_text(self, text, x, y, color=WHITE, centered=True):
-        surface = self.georgian_font.render(text, True, color)
+    def tile_at(self, pos):
+        # Work out the grid cell directly from the click position
+        step = self.tile_size + self.padding
+        dx, dy = pos[0] - self.start_x, pos[1] - self.start_y
+        if dx < 0 or dy < 0 or dx % step >= self.tile_size or dy % step >= self.tile_size:
+            return None
+        col, row = dx // step, dy // step
+        if col >= self.cols or row >= self.rows:
+            return None
+        return self.active_tiles[row * self.cols + col]
+    
+    def tiles_near(self, rect):
+        # Tiles whose cells touch rect, widened by one cell for celebrate growth and shake
+        if not self.active_tiles:
+            return []
+        step = self.tile_size + self.padding
+        first_col = max(0, (rect.left - self.start_x) // step - 1)
+        last_col = min(self.cols - 1, (rect.right - self.start_x) // step + 1)
+        first_row = max(0, (rect.top - self.start_y) // step - 1)
+        last_row = min(self.rows - 1, (rect.bottom - self.start_y) // step + 1)
+        return [self.active_tiles[row * self.cols + col]
+                for row in range(first_row, last_row + 1)
+                for col in range(first_col, last_col + 1)]
+    
+    def board_size(self):
+        if not self.BOARD_OVERRIDE:
+            return board_size(self.level)
+        cols, rows = (int(n) for n in self.BOARD_OVERRIDE.lower().split("x"))
+        if cols * rows % 2:
+            rows += 1
+        return cols, rows
+    
+    def layout_board(self, cols, rows):
+        # Fit the board between the HUD lines, never growing tiles past their source size
+        available_width = self.SCREEN_WIDTH - 2 * self.PADDING
+        available_height = self.SCREEN_HEIGHT - self.HUD_MARGIN_TOP - self.HUD_MARGIN_BOTTOM
+        ratio = self.PADDING / self.TILE_SIZE
+        tile_size = min(self.TILE_SIZE,
+                        int(available_width / (cols + (cols - 1) * ratio)),
+                        int(available_height / (rows + (rows - 1) * ratio)))
+        self.tile_size = max(8, tile_size)
+        self.padding = max(2, int(self.tile_size * ratio))
+        self.cols, self.rows = cols, rows
+        self.start_x = (self.SCREEN_WIDTH - (self.tile_size + self.padding) * cols + self.padding) // 2
+        self.start_y = self.HUD_MARGIN_TOP + (available_height - (self.tile_size + self.padding) * rows + self.padding) // 2
+    
+    def render_frame(self):
+        self.draw_tiles()
+        self.present()
+    
+    def slot_changed(self, slot, key):
+        previous = self.hud_slots.get(slot)
+        return previous is None or previous[0] != key or previous[1].collidelist(self.dirty_rects) != -1
+    
+    def claim_slot(self, slot, key, rect):
+        # Clear whatever the slot showed before drawing its new contents
+        previous = self.hud_slots.get(slot)
+        if self.dirty_rendering and previous:
+            self.restore_region(previous[1].union(rect))
+        self.hud_slots[slot] = (key, rect)
+    
+    def clear_slot(self, slot):
+        previous = self.hud_slots.pop(slot, None)
+        if previous:
+            self.restore_region(previous[1])
+    
+    def display_text(self, text, x, y, color=WHITE, centered=True, slot=None):
+        surface = self.text_cache.render(self.georgian_font, text, color)
         if centered:
             rect = surface.get_rect(center=(x, y))
         else:
             rect = surface.get_rect(topleft=(x, y))
+        if slot is not None:
+            key = (text, tuple(color), rect.topleft)
+            if not self.slot_changed(slot, key):
+                return rect
+            self.claim_slot(slot, key, rect)
+        elif self.dirty_rendering:
+            # One-off text gets cleaned up on the next frame
+            self.transient_rects.append(rect)
         self.screen.blit(surface, rect)
+        self.mark_dirty(rect)
+        return rect
+    
+    def display_text_parts(self, parts, x, y, color=WHITE, gap=60, slot="parts"):
+        # Lay out a centered line from separately cached pieces so only changed pieces are redrawn
+        surfaces = [self.text_cache.render(self.georgian_font, part, color) for part in parts]
+        total_width = sum(s.get_width() for s in surfaces) + gap * (len(surfaces) - 1)
+        left = x - total_width // 2
+        for idx, (part, surface) in enumerate(zip(parts, surfaces)):
+            top = y - surface.get_height() // 2
+            self.display_text(part, left, top, color, centered=False, slot=(slot, idx))
+            left += surface.get_width() + gap
     
     def create_level(self):
-        self.current_background = random.choice(self.background_images)
-        self.screen.blit(self.current_background, (0, 0))
-        pygame.display.flip()
+        # Each new level moves on to the next theme, which was prefetched when this one started
+        if self.theme_level is not None and self.theme_level != self.level:
+            self.set_theme(self.themes.next_after(self.theme))
+        self.theme_level = self.level
+        self.current_background = self.background_images[self.theme]
+        
+        cols, rows = self.board_size()
+        self.layout_board(cols, rows)
+        pair_count = cols * rows // 2
         
-        # Select random tiles for this level
+        # Select random tiles for this level, reusing animals when the board has more pairs than images
         tile_keys = list(self.image_names.keys())
-        random.shuffle(tile_keys)
-        selected_keys = tile_keys[:8]
-        tile_images = selected_keys * 2
-        random.shuffle(tile_images)
+        self.rng.shuffle(tile_keys)
+        selected_keys = tile_keys[:pair_count]
+        pair_ids = level_pair_ids(pair_count, len(tile_keys))
         
-        # Create tile grid
-        tiles = []
-        cols, rows = 4, 4
-        self.start_x = (self.SCREEN_WIDTH - (self.TILE_SIZE + self.PADDING) * cols + self.PADDING) // 2
-        self.start_y = (self.SCREEN_HEIGHT - (self.TILE_SIZE + self.PADDING) * rows + self.PADDING) // 2
+        # Start decoding this level's faces and animal sounds in parallel
+        self.loaded_images.prefetch(selected_keys)
+        self.prefetch_level_sounds([key for key in selected_keys if key in self.animal_sounds])
+        
+        # Pack this level's faces into one atlas at the level's tile size
+        self.atlas = TileAtlas(self.loaded_images, selected_keys + [self.back_image_name],
+                               self.tile_size, self.back_image_name)
+        
+        # Pre-render celebrate frames for this level's images only
+        self.frame_cache.clear()
+        self.frame_cache.build(self.atlas, selected_keys)
+        self.rng.shuffle(pair_ids)
+        self.model.new_level(cols, rows, pair_ids, self.time_limit_for(self.level))
+        self.last_flip_ms = 0
         
+        # Create tile grid; tiles only hold layout and animation state, the model holds the rest
+        tiles = []
+        step = self.tile_size + self.padding
         for i in range(rows):
             for j in range(cols):
-                x = self.start_x + j * (self.TILE_SIZE + self.PADDING)
-                y = self.start_y + i * (self.TILE_SIZE + self.PADDING)
+                x = self.start_x + j * step
+                y = self.start_y + i * step
                 idx = i * cols + j
-                tiles.append(Tile(x, y, tile_images[idx], self.TILE_SIZE))
+                tiles.append(Tile(x, y, tile_keys[pair_ids[idx]], self.tile_size, self.model, idx))
         
-        # Show all tiles briefly
-        for tile in tiles:
-            tile.revealed = True
+        # Show all tiles briefly, then hide them and hand control to the player
+        self.model.reveal_all()
         
         self.active_tiles = tiles
-        self.draw_tiles()
-        pygame.display.flip()
+        self.invalidate()
+        self.phase = "reveal"
         
-        # Wait and hide tiles
-        time.sleep(2)
-        for tile in tiles:
-            tile.revealed = False
+        def hide_tiles():
+            self.model.hide_all()
+            self.phase = "play"
         
+        self.animations.wait(self.REVEAL_MS, hide_tiles)
         return tiles
     
-    def shake_tiles(self, tiles):
-        for _ in range(6):
+    def start_level(self):
+        self.animations.clear()
+        self.clear_slot("overlay")
+        self.create_level()
+    
+    def shake_tiles(self, tiles, done=None):
+        steps = 12
+        last_step = -1
+        
+        def step(progress):
+            nonlocal last_step
+            current = min(int(progress * steps), steps - 1)
+            if current == last_step:
+                return
+            last_step = current
             for tile in tiles:
-                tile.shake_offset = random.choice([-5, 5])
-            self.draw_tiles()
-            pygame.display.flip()
-            time.sleep(0.05)
-            
+                tile.shake_offset = self.rng.choice([-5, 5]) if current % 2 == 0 else 0
+        
+        def finish():
             for tile in tiles:
                 tile.shake_offset = 0
-            self.draw_tiles()
-            pygame.display.flip()
-            time.sleep(0.05)
+            if done:
+                done()
+        
+        return self.animations.add(steps * 50, step, finish)
     
-    def retry_prompt(self):
-        retry_text = self.georgian_font.render("სცადეთ თავიდან", True, self.WHITE)
-        retry_rect = retry_text.get_rect(center=(self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2))
-        self.screen.blit(retry_text, retry_rect)
-        pygame.display.flip()
+    def show_message(self, text, duration, done=None):
+        # Overlay a centered message for a while without blocking the loop
+        self.phase = "message"
+        self.overlay_text = text
         
-        waiting = True
-        while waiting:
-            for e in pygame.event.get():
-                if e.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                elif e.type == pygame.MOUSEBUTTONDOWN:
-                    if retry_rect.collidepoint(e.pos):
-                        waiting = False
-                elif e.type == pygame.KEYDOWN:
-                    if e.key == pygame.K_RETURN or e.key == pygame.K_SPACE:
-                        waiting = False
+        def finish():
+            self.overlay_text = None
+            self.clear_slot("overlay")
+            if done:
+                done()
+        
+        self.animations.wait(duration, finish)
     
-    def create_button(self, text, rect, mouse_pos=None):
+    def retry_prompt(self):
+        self.phase = "retry"
+        self.overlay_text = "სცადეთ თავიდან"
+    
+    def create_button(self, text, rect, mouse_pos=None, slot=None):
         color = self.HOVER_COLOR if mouse_pos and rect.collidepoint(mouse_pos) else self.BUTTON_COLOR
-        pygame.draw.rect(self.screen, color, rect, border_radius=self.BUTTON_RADIUS)
-        text_surf = self.georgian_font.render(text, True, self.WHITE)
+        if slot is not None:
+            if not self.slot_changed(slot, (text, color)):
+                return rect
+            self.claim_slot(slot, (text, color), rect)
+        self.mark_dirty(rect)
+        self.screen.blit(self.button_body(rect.size, color), rect)
+        text_surf = self.text_cache.render(self.georgian_font, text, self.WHITE)
         text_rect = text_surf.get_rect(center=rect.center)
         self.screen.blit(text_surf, text_rect)
         return rect
     
-    def game_loop(self):
+    def time_out(self):
+        self.play_sound("lose")
+        self.record_level("timeout")
+        self.phase = "message"
+        
+        def lose_try():
+            tries = self.model.lose_try()
+            self.telemetry.record(telemetry.TIMEOUT, self.level, self.model.elapsed_ms, tries)
+            if tries == 0:
+                self.show_message("თამაში დასრულდა! სცადეთ თავიდან!", 2000, self.end_game)
+            else:
+                self.retry_prompt()
+        
+        self.animations.wait(1000, lose_try)
+    
+    def end_game(self):
+        self.telemetry.record(telemetry.GAME_OVER, self.level, self.model.elapsed_ms, self.score)
+        self.reset_game()
+        self.game_over = True
+    
+    def select_tile(self, pos):
+        tile = self.tile_at(pos)
+        if tile and self.model.flip(tile.index):
+            self.play_sound("click")
+            
+            # Level time only runs during play, so these measure the player's thinking time
+            elapsed = self.model.elapsed_ms
+            self.telemetry.record(telemetry.FLIP, self.level, tile.index, elapsed - self.last_flip_ms)
+            self.last_flip_ms = elapsed
+            if not self.model.pair_ready:
+                self.pair_started_ms = elapsed
+        
+        # Give the player a moment to see the pair before resolving it
+        if self.model.pair_ready:
+            self.phase = "checking"
+            self.animations.wait(500, self.resolve_pair)
+    
+    def resolve_pair(self):
+        result, first, second = self.model.resolve()
+        first, second = self.active_tiles[first], self.active_tiles[second]
+        self.telemetry.record(telemetry.MATCH if result == MATCH else telemetry.MISMATCH, self.level,
+                              first.index, self.model.elapsed_ms - self.pair_started_ms)
+        
+        if result == MATCH:
+            # Match found
+            self.play_sound("good")
+            
+            # Play animal sound if available
+            if first.image_name in self.animal_sounds:
+                self.play_sound(first.image_name)
+            
+            # Celebrate animation
+            first.celebrate(self.animations)
+            celebration = second.celebrate(self.animations)
+            
+            if self.model.complete:
+                self.phase = "message"
+                celebration.done = self.complete_level
+            else:
+                self.phase = "play"
+        else:
+            # No match
+            def hide_pair():
+                self.model.hide(first.index, second.index)
+                if result == MISMATCH_LIMIT:
+                    self.show_message("მცდარი სვლებია", 2000, self.resume_play)
+                else:
+                    self.phase = "play"
+            
+            self.shake_tiles([first, second], hide_pair)
+    
+    def resume_play(self):
+        self.phase = "play"
+    
+    def complete_level(self):
+        self.play_sound(self.rng.choice(self.win_sounds))
+        self.record_level("cleared")
+        self.telemetry.record(telemetry.LEVEL_CLEAR, self.level, self.model.elapsed_ms, self.model.mistakes)
+        self.model.complete_level()
+        self.save_game()
+        
+        # Show level complete message
+        self.show_message(f"დონე {self.level-1} დასრულებულია!", 2000, self.start_level)
+    
+    def button_body(self, size, color):
+        def rounded(surface):
+            surface.fill((0, 0, 0, 0))
+            pygame.draw.rect(surface, color, surface.get_rect(), border_radius=self.BUTTON_RADIUS)
+        return self.surfaces.overlay(("button", color), size, (0, 0, 0, 0), rounded)
+    
+    def begin_play(self):
         self.load_game()
-        tries_left = self.energy
+        self.model.tries = self.energy
+        self.overlay_text = None
+        self.overlay_rect = None
+        self.game_over = False
         
         # Create back button
         back_button_width = 180
         back_button_height = 50
-        back_button_rect = pygame.Rect(
+        self.back_button_rect = pygame.Rect(
             self.SCREEN_WIDTH - back_button_width - 20, 
             20, 
             back_button_width, 
             back_button_height
         )
         
-        while tries_left > 0:
-            tiles = self.create_level()
-            selected = []
-            matched = 0
-            start_time = pygame.time.get_ticks()
-            time_limit = random.choice([30, 60, 90, 120])
-            consecutive_mistakes = 0
-            exit_to_menu = False
-            
-            while True:
-                elapsed = (pygame.time.get_ticks() - start_time) // 1000
-                time_left = max(0, time_limit - elapsed)
-                
-                # Check for time out
-                if time_left <= 0:
-                    self.lose_sound.play()
-                    time.sleep(1)
-                    tries_left -= 1
-                    if tries_left == 0:
-                        self.display_text("თამაში დასრულდა! სცადეთ თავიდან!", 
-                                         self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2)
-                        pygame.display.flip()
-                        time.sleep(2)
-                        self.reset_game()
-                        return
-                    else:
-                        self.retry_prompt()
-                        break
-                
-                # Draw game state
-                self.draw_tiles()
-                
-                # Display HUD
-                self.display_text(f"ქულა: {self.score}     დრო: {elapsed}წმ     ენერგია: {tries_left}", 
-                                 self.SCREEN_WIDTH // 2, 20)
-                                # Time limit warning
-                time_color = self.WHITE
-                if time_left <= 10:  # Warning when time is running out
-                    time_color = (255, 50, 50) if time_left % 2 == 0 else self.WHITE
-                
-                self.display_text(f"დრო: {time_left}წმ", self.SCREEN_WIDTH // 2, 
-                                 self.SCREEN_HEIGHT - 50, time_color)
-                
-                # Draw back button
-                mouse_pos = pygame.mouse.get_pos()
-                self.create_button("უკან", back_button_rect, mouse_pos)
-                
-                pygame.display.flip()
-                self.clock.tick(60)  # Limit to 60 FPS for consistent performance
-                
-                # Handle events
-                for e in pygame.event.get():
-                    if e.type == pygame.QUIT:
-                        pygame.quit()
-                        sys.exit()
-                    elif e.type == pygame.KEYDOWN:
-                        if e.key == pygame.K_ESCAPE:
-                            exit_to_menu = True
-                            break
-                    elif e.type == pygame.MOUSEBUTTONDOWN:
-                        pos = pygame.mouse.get_pos()
-                        
-                        # Check back button
-                        if back_button_rect.collidepoint(pos):
-                            self.button_click_sound.play()
-                            exit_to_menu = True
-                            break
-                        
-                        # Check tile clicks
-                        for tile in tiles:
-                            if tile.check_click(pos) and tile not in selected:
-                                self.click_sound.play()
-                                selected.append(tile)
-                                break
-                        
-                        # Process pair selection
-                        if len(selected) == 2:
-                            pygame.display.flip()
-                            time.sleep(0.5)
-                            
-                            if selected[0].image_name == selected[1].image_name:
-                                # Match found
-                                selected[0].found = True
-                                selected[1].found = True
-                                self.score += 7
-                                matched += 1
-                                self.good_sound.play()
-                                
-                                # Play animal sound if available
-                                if selected[0].image_name in self.animal_sounds:
-                                    self.animal_sounds[selected[0].image_name].play()
-                                
-                                # Celebrate animation
-                                selected[0].celebrate(self.screen, self.loaded_images, self.active_tiles, self.draw_tiles)
-                                selected[1].celebrate(self.screen, self.loaded_images, self.active_tiles, self.draw_tiles)
-                                
-                                consecutive_mistakes = 0
-                            else:
-                                # No match
-                                self.shake_tiles(selected)
-                                for t in selected:
-                                    t.revealed = False
-                                
-                                consecutive_mistakes += 1
-                                if consecutive_mistakes == 3:
-                                    self.display_text("მცდარი სვლებია", 
-                                                    self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2)
-                                    pygame.display.flip()
-                                    time.sleep(2)
-                                    consecutive_mistakes = 0
-                            
-                            selected = []
-                
-                if exit_to_menu:
-                    self.save_game()
-                    return
-                
-                if matched == 8:
-                    # Level completed
-                    random.choice(self.win_sounds).play()
-                    self.level += 1
-                    self.save_game()
-                    
-                    # Show level complete message
-                    self.display_text(f"დონე {self.level-1} დასრულებულია!", 
-                                     self.SCREEN_WIDTH // 2, self.SCREEN_HEIGHT // 2)
-                    pygame.display.flip()
-                    time.sleep(2)
+        self.start_level()
+    
+    def play_frame(self, dt, events, mouse_pos=None):
+        # One frame of play: simulate up to now, apply input, render and present.
+        # Returns True when the player left for the menu.
+        
+        # Bring animations and the level timer up to now so input lands on the current state
+        self.animations.update(dt)
+        if self.game_over:
+            return False
+        if self.phase == "play" and self.model.tick(dt):
+            self.time_out()
+        
+        # Apply input in the same frame it arrived
+        exit_to_menu = False
+        for e in events:
+            self.audio.handle_event(e)
+            if e.type == pygame.QUIT:
+                self.quit()
+            elif e.type == pygame.KEYDOWN:
+                if e.key == pygame.K_ESCAPE:
+                    self.telemetry.record(telemetry.ABANDON, self.level, self.model.elapsed_ms, telemetry.ESCAPE)
+                    exit_to_menu = True
+                    break
+                elif self.phase == "retry" and e.key in (pygame.K_RETURN, pygame.K_SPACE):
+                    self.start_level()
+            elif e.type == pygame.MOUSEBUTTONDOWN:
+                # Check back button
+                if self.back_button_rect.collidepoint(e.pos):
+                    self.play_sound("button_click")
+                    self.telemetry.record(telemetry.ABANDON, self.level, self.model.elapsed_ms, telemetry.BACK_BUTTON)
+                    exit_to_menu = True
                     break
+                
+                if self.phase == "retry":
+                    if self.overlay_rect and self.overlay_rect.collidepoint(e.pos):
+                        self.start_level()
+                elif self.phase == "play":
+                    self.select_tile(e.pos)
+        
+        if exit_to_menu:
+            self.animations.clear()
+            self.save_game()
+            return True
+        
+        elapsed = self.model.elapsed_seconds
+        time_left = self.model.time_left
+        
+        # Draw game state
+        with self.profiler.phase("draw_tiles"):
+            self.draw_tiles()
+        
+        # Display HUD
+        with self.profiler.phase("display_text"):
+            self.display_text_parts([f"ქულა: {self.score}", f"დრო: {elapsed}წმ", f"ენერგია: {self.model.tries}"], 
+                                    self.SCREEN_WIDTH // 2, 20, slot="status")
+                            # Time limit warning
+            time_color = self.WHITE
+            if time_left <= 10:  # Warning when time is running out
+                time_color = (255, 50, 50) if time_left % 2 == 0 else self.WHITE
+            
+            self.display_text(f"დრო: {time_left}წმ", self.SCREEN_WIDTH // 2, 
+                             self.SCREEN_HEIGHT - 50, time_color, slot="time_left")
+        
+        # Draw back button
+        with self.profiler.phase("create_button"):
+            self.create_button("უკან", self.back_button_rect, mouse_pos, slot="back")
+        
+        # Message and retry overlays
+        self.overlay_rect = None
+        if self.overlay_text:
+            self.overlay_rect = self.display_text(self.overlay_text, self.SCREEN_WIDTH // 2, 
+                                                  self.SCREEN_HEIGHT // 2, slot="overlay")
+        
+        self.draw_profiler_overlay()
+        with self.profiler.phase("flip"):
+            self.present()
+        return False
+    
+    def game_loop(self):
+        self.begin_play()
+        first_frame = True
+        
+        while not self.game_over:
+            # Input first: wait for the frame (a click or key press ends the wait at once), then drain
+            # and timestamp everything that arrived before touching game state
+            with self.profiler.phase("tick"):
+                dt = self.scheduler.tick(self.input, 0 if first_frame else self.next_frame_due())
+            with self.profiler.phase("events"):
+                events = self.input.events()
+            self.scheduler.latency.received(events, self.input.woke_at)
+            if first_frame:
+                dt = 0  # Level setup time doesn't count against the reveal
+                first_frame = False
+            
+            if self.play_frame(dt, events, self.mouse_pos()):
+                return
+            self.scheduler.latency.presented()
+            self.profiler.end_frame()
+        
+        self.animations.clear()
     
     def menu(self):
         self.load_game()
-        self.current_background = random.choice(self.background_images)
+        self.set_theme(self.theme)
+        self.current_background = self.wait_for(self.background_images, self.theme)
         
         # Button properties
         button_width = 400
@@ -440,7 +928,7 @@ class MemoryGame:
         button_spacing = 40
         
         # Texts
-        button_texts = ["თამაში დაწყება", "განახლება", "გასვლა"]
+        button_texts = ["თამაში დაწყება", "თემა", "განახლება", "გასვლა"]
         
         # Pre-rendered buttons
         buttons = []
@@ -456,28 +944,19 @@ class MemoryGame:
             )
             buttons.append((text, rect))
         
-        # Main menu loop
+        # Main menu loop, input first like the game loop
         running = True
+        first_frame = True
         while running:
-            mouse_pos = pygame.mouse.get_pos()
-            
-            # Draw background
-            self.screen.blit(self.current_background, (0, 0))
-            
-            # Draw title
-            self.display_text("მეხსიერების თამაში", self.SCREEN_WIDTH // 2, start_y - 100)
-            self.display_text(f"ქულა: {self.score} | დონე: {self.level}", 
-                             self.SCREEN_WIDTH // 2, start_y - 40)
-            
-            # Draw buttons
-            for text, rect in buttons:
-                self.create_button(text, rect, mouse_pos)
+            with self.profiler.phase("tick"):
+                self.scheduler.tick(self.input, 0 if first_frame else None)
+            first_frame = False
+            with self.profiler.phase("events"):
+                events = self.input.events()
+            self.scheduler.latency.received(events, self.input.woke_at)
             
-            pygame.display.flip()
-            self.clock.tick(60)
-            
-            # Handle events
-            for e in pygame.event.get():
+            for e in events:
+                self.audio.handle_event(e)
                 if e.type == pygame.QUIT:
                     running = False
                 elif e.type == pygame.KEYDOWN:
@@ -486,61 +965,1280 @@ class MemoryGame:
                 elif e.type == pygame.MOUSEBUTTONDOWN:
                     for idx, (_, rect) in enumerate(buttons):
                         if rect.collidepoint(e.pos):
-                            self.button_click_sound.play()
+                            self.play_sound("button_click")
                             
                             if idx == 0:  # Start
+                                self.theme_level = None  # Play starts on the theme picked here
                                 self.game_loop()
                                 self.load_game()  # Refresh displayed score/level
-                            elif idx == 1:  # Reset
+                                self.current_background = self.wait_for(self.background_images, self.theme)
+                            elif idx == 1:  # Theme
+                                self.set_theme(self.themes.next_after(self.theme))
+                                self.current_background = self.wait_for(self.background_images, self.theme)
+                            elif idx == 2:  # Reset
                                 self.reset_game()
-                            elif idx == 2:  # Exit
+                            elif idx == 3:  # Exit
                                 running = False
+            if not running:
+                break
+            
+            mouse_pos = self.mouse_pos()
+            
+            # The menu always repaints the whole screen
+            self.invalidate()
+            
+            # Draw background
+            self.screen.blit(self.current_background, (0, 0))
+            
+            # Draw title
+            with self.profiler.phase("display_text"):
+                self.display_text("მეხსიერების თამაში", self.SCREEN_WIDTH // 2, start_y - 100)
+                self.display_text(f"{self.player} | ქულა: {self.score} | დონე: {self.level}", 
+                                 self.SCREEN_WIDTH // 2, start_y - 40)
+            
+            # Draw buttons
+            with self.profiler.phase("create_button"):
+                for idx, (text, rect) in enumerate(buttons):
+                    if idx == 1:
+                        text = f"{text}: {self.theme_label()}"
+                    self.create_button(text, rect, mouse_pos)
+            
+            self.profiler.draw(self.screen)
+            with self.profiler.phase("flip"):
+                self.flip_display()
+            self.scheduler.latency.presented()
+            self.profiler.end_frame()
         
-        pygame.quit()
-        sys.exit()
+        self.quit()
 
 
 class Tile:
-    def __init__(self, x, y, image, size):
+    CELEBRATE_SCALES = [1.05, 1.1, 1.15, 1.2, 1.15, 1.1, 1.05, 1.0]
+    
+    def __init__(self, x, y, image, size, model, index):
         self.rect = pygame.Rect(x, y, size, size)
         self.image_name = image
-        self.revealed = False
-        self.found = False
+        self.model = model
+        self.index = index
         self.shake_offset = 0
         self.match_scale = 1.0
+        self.drawn_state = None
+        self.drawn_rect = None
     
-    def draw(self, screen, loaded_images):
-        img = loaded_images[self.image_name] if self.revealed or self.found else loaded_images["A.png"]
-        
-        if self.found:
-            img = pygame.transform.rotozoom(img, 0, self.match_scale)
+    @property
+    def revealed(self):
+        return self.model.revealed(self.index)
+    
+    @property
+    def found(self):
+        return self.model.found(self.index)
+    
+    def render_state(self):
+        return (self.revealed or self.found, self.found, self.match_scale, self.shake_offset)
+    
+    def needs_redraw(self):
+        return self.render_state() != self.drawn_state
+    
+    def bounds(self):
+        # Area the tile covers in its current state, including celebrate growth
+        grow = int(self.rect.width * max(0, self.match_scale - 1)) + 2 if self.found else 0
+        rect = self.rect.inflate(grow, grow)
+        rect.x += self.shake_offset
+        return rect
+    
+    def draw(self, screen, atlas, frame_cache=None):
+        name = self.image_name if self.revealed or self.found else atlas.back_name
         
-        rect = img.get_rect(center=self.rect.center)
-        if self.shake_offset:
+        # Found tiles at rest blit straight from the atlas; only celebrating tiles need a scaled frame
+        if self.found and self.match_scale != 1.0:
+            if frame_cache is not None:
+                img = frame_cache.get(atlas, name, self.match_scale)
+            else:
+                img = pygame.transform.rotozoom(atlas.face(name), 0, self.match_scale)
+            rect = img.get_rect(center=self.rect.center)
             rect.x += self.shake_offset
+            screen.blit(img, rect)
+        else:
+            rect = self.rect.move(self.shake_offset, 0)
+            atlas.blit(screen, name, rect)
+        self.drawn_state = self.render_state()
+        self.drawn_rect = rect
+    
+    def celebrate(self, scheduler, frame_ms=30):
+        original_scale = self.match_scale
+        scales = self.CELEBRATE_SCALES
+        
+        def step(progress):
+            self.match_scale = scales[min(int(progress * len(scales)), len(scales) - 1)]
+        
+        def finish():
+            self.match_scale = original_scale
         
-        screen.blit(img, rect)
+        return scheduler.add(frame_ms * len(scales), step, finish)
+
+
+class TextCache:
+    # Bounded LRU cache of rendered text surfaces keyed by (text, color, font, antialias)
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
     
-    def check_click(self, pos):
-        if self.rect.collidepoint(pos) and not self.revealed and not self.found:
-            self.revealed = True
-            return True
-        return False
+    def render(self, font, text, color, antialias=True):
+        key = (text, tuple(color), font, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
     
-    def celebrate(self, screen, loaded_images, all_tiles, draw_function):
-        original_scale = self.match_scale
+    def clear(self):
+        self.surfaces.clear()
+    
+    def stats(self):
+        return {"entries": len(self.surfaces), "hits": self.hits, "misses": self.misses}
+
+
+class Tween:
+    def __init__(self, duration, update=None, done=None, delay=0):
+        self.duration = duration
+        self.update = update
+        self.done = done
+        self.elapsed = -delay
+    
+    def advance(self, dt):
+        self.elapsed += dt
+        if self.elapsed < 0:
+            return False
+        progress = min(1.0, self.elapsed / self.duration) if self.duration > 0 else 1.0
+        if self.update:
+            self.update(progress)
+        return progress >= 1.0
+
+
+class AnimationScheduler:
+    # Drives timed animations from clock.tick deltas so the main loop never has to sleep
+    def __init__(self):
+        self.tweens = []
+    
+    def add(self, duration, update=None, done=None, delay=0):
+        tween = Tween(duration, update, done, delay)
+        self.tweens.append(tween)
+        return tween
+    
+    def wait(self, duration, done):
+        return self.add(duration, done=done)
+    
+    def update(self, dt):
+        # Callbacks may add new tweens or clear the schedule while we iterate
+        for tween in list(self.tweens):
+            if tween not in self.tweens:
+                continue
+            if tween.advance(dt):
+                self.tweens.remove(tween)
+                if tween.done:
+                    tween.done()
+    
+    def busy(self):
+        return bool(self.tweens)
+    
+    def next_due(self):
+        # Time until a plain timer fires; tweens that are animating need every frame
+        due = None
+        for tween in self.tweens:
+            if tween.update and tween.elapsed >= 0:
+                return 0
+            remaining = -tween.elapsed if tween.update else tween.duration - tween.elapsed
+            due = remaining if due is None else min(due, remaining)
+        return due
+    
+    def clear(self):
+        self.tweens = []
+
+
+class TileAtlas:
+    # Every face a level uses packed into one surface, drawn with area blits
+    def __init__(self, images, names, size, back_name):
+        self.size = size
+        self.back_name = back_name
+        columns = max(1, math.ceil(math.sqrt(len(names))))
+        rows = math.ceil(len(names) / columns)
+        self.surface = pygame.Surface((columns * size, rows * size), pygame.SRCALPHA)
+        self.surface.fill((0, 0, 0, 0))
+        self.areas = {}
+        for idx, name in enumerate(names):
+            area = pygame.Rect((idx % columns) * size, (idx // columns) * size, size, size)
+            face = images[name]
+            if face.get_size() != (size, size):
+                face = pygame.transform.smoothscale(face, (size, size))
+            # MAX onto a cleared surface copies pixels and alpha exactly
+            self.surface.blit(face, area, special_flags=pygame.BLEND_RGBA_MAX)
+            self.areas[name] = area
+        self.surface = self.surface.convert_alpha()
+    
+    def face(self, name):
+        return self.surface.subsurface(self.areas[name])
+    
+    def blit(self, screen, name, dest):
+        screen.blit(self.surface, dest, self.areas[name])
+
+
+class AnimationFrameCache:
+    # Pre-scaled celebrate frames per tile image, rebuilt whenever a level picks new images
+    def __init__(self, scales):
+        self.scales = sorted(set(s for s in scales if s != 1.0))
+        self.frames = {}
+    
+    def build(self, atlas, names):
+        for name in names:
+            for scale in self.scales:
+                self.get(atlas, name, scale)
+    
+    def get(self, atlas, name, scale):
+        key = (name, scale)
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = pygame.transform.rotozoom(atlas.face(name), 0, scale)
+            self.frames[key] = frame
+        return frame
+    
+    def clear(self):
+        self.frames.clear()
+
+
+def decode_jpg(source, opacity):
+    # Module-level so it can run in a worker process; source is a path or the file's bytes
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source).convert("RGBA")
+    img.putalpha(opacity)
+    return img.tobytes(), img.size, img.mode
+
+
+class AssetGroup:
+    # Dict-like view over assets that load on worker threads; lookups block until ready
+    def __init__(self, manager, loader, sources, finalize=None):
+        self.manager = manager
+        self.loader = loader
+        self.sources = dict(sources)
+        self.finalize = finalize
+        self.futures = {}
+        self.items = {}
+    
+    def request(self, name):
+        future = self.futures.get(name)
+        if future is None:
+            future = self.manager.submit(self.loader, self.sources[name])
+            self.futures[name] = future
+        return future
+    
+    def prefetch(self, names=None):
+        for name in self.sources if names is None else names:
+            if name not in self.items:
+                self.request(name)
+    
+    def ready(self, name):
+        return name in self.items or (name in self.futures and self.futures[name].done())
+    
+    def keys(self):
+        return list(self.sources)
+    
+    def __contains__(self, name):
+        return name in self.sources
+    
+    def discard(self, name):
+        # Drop the decoded copy; the next request loads it again
+        self.futures.pop(name, None)
+        self.items.pop(name, None)
+    
+    def __getitem__(self, name):
+        # Finalize runs once on the main thread, e.g. to convert to the display format
+        item = self.items.get(name)
+        if item is None:
+            item = self.request(name).result()
+            if self.finalize:
+                item = self.finalize(item)
+            self.items[name] = item
+            # The future holds the unconverted surface (and any disk cache mapping behind it)
+            self.futures.pop(name, None)
+        return item
+
+
+class ThemeLibrary:
+    # Theme packs are the folders under assets/background_img; loose files there form the "default"
+    # pack. Source files stay compressed in RAM (LRU, under a byte budget) and are decoded on demand.
+    EXTENSIONS = (".jpg", ".jpeg", ".png")
+    
+    def __init__(self, root, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.paths = {}
+        for path in sorted(glob.glob(os.path.join(root, "*")) + glob.glob(os.path.join(root, "*", "*"))):
+            if os.path.isfile(path) and path.lower().endswith(self.EXTENSIONS):
+                folder = os.path.dirname(path)
+                pack = "default" if os.path.samefile(folder, root) else os.path.basename(folder)
+                self.paths[f"{pack}/{os.path.splitext(os.path.basename(path))[0]}"] = path
+        self.compressed = OrderedDict()
+        self.compressed_bytes = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+    
+    def names(self):
+        return list(self.paths)
+    
+    def packs(self):
+        return sorted({name.split("/")[0] for name in self.paths})
+    
+    def label(self, name):
+        return name.split("/")[-1]
+    
+    def next_after(self, name):
+        names = self.names()
+        if name not in self.paths:
+            return names[0] if names else name
+        return names[(names.index(name) + 1) % len(names)]
+    
+    def data(self, name):
+        # Called from loader threads
+        with self.lock:
+            if name in self.compressed:
+                self.compressed.move_to_end(name)
+                return self.compressed[name]
+        with open(self.paths[name], "rb") as f:
+            data = f.read()
+        with self.lock:
+            self.reads += 1
+            if name not in self.compressed and len(data) <= self.budget_bytes:
+                self.compressed[name] = data
+                self.compressed_bytes += len(data)
+                while self.compressed_bytes > self.budget_bytes:
+                    _, evicted = self.compressed.popitem(last=False)
+                    self.compressed_bytes -= len(evicted)
+        return data
+    
+    def stats(self):
+        return {
+            "themes": len(self.paths),
+            "packs": len(self.packs()),
+            "compressed_entries": len(self.compressed),
+            "compressed_bytes": self.compressed_bytes,
+            "budget_bytes": self.budget_bytes,
+            "file_reads": self.reads
+        }
+
+
+class AssetManager:
+    def __init__(self, workers=4, use_processes=False):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.process_pool = ProcessPoolExecutor(max_workers=workers) if use_processes else None
+        # Only counts are kept; holding finished futures would keep every loaded asset alive
+        self.submitted = 0
+        self.completed = 0
+        self.lock = threading.Lock()
+    
+    def group(self, loader, sources, finalize=None):
+        return AssetGroup(self, loader, sources, finalize)
+    
+    def submit(self, fn, *args):
+        future = self.executor.submit(fn, *args)
+        with self.lock:
+            self.submitted += 1
+        future.add_done_callback(self.finished)
+        return future
+    
+    def finished(self, future):
+        with self.lock:
+            self.completed += 1
+    
+    def decode(self, fn, *args):
+        # CPU-heavy PIL work goes to the process pool when one is configured
+        if self.process_pool is not None:
+            return self.process_pool.submit(fn, *args).result()
+        return fn(*args)
+    
+    def progress(self):
+        return self.completed, self.submitted
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SurfaceDiskCache:
+    # Pre-scaled RGBA pixel buffers on disk, keyed by source mtime, target size and opacity
+    VERSION = 1
+    
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            print(f"Error creating asset cache {directory}: {e}")
+            self.directory = None
+    
+    def entry_path(self, source, size, opacity):
+        if self.directory is None:
+            return None
+        try:
+            mtime = os.stat(source).st_mtime_ns
+        except OSError:
+            return None
+        # source-stamp-variant: one source can have entries for several sizes and opacities, and
+        # only entries with an older stamp (cache version and source mtime) are stale
+        source_id = hashlib.sha1(os.path.abspath(source).encode("utf-8")).hexdigest()[:16]
+        key = hashlib.sha1(f"{size[0]}x{size[1]}:{opacity}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{source_id}-{self.VERSION}.{mtime}-{key}.rgba")
+    
+    def load(self, source, size, opacity=None):
+        path = self.entry_path(source, size, opacity)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            if len(buffer) != size[0] * size[1] * 4:
+                buffer.close()
+                return None
+            surface = pygame.image.frombuffer(buffer, size, "RGBA")
+        except (OSError, ValueError) as e:
+            print(f"Error reading cached image {path}: {e}")
+            return None
+        # The surface reads straight from the mapping and keeps it alive; dropping the surface unmaps it
+        return surface
+    
+    def store(self, source, size, opacity, surface):
+        path = self.entry_path(source, size, opacity)
+        if path is None:
+            return
+        try:
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(pygame.image.tostring(surface, "RGBA"))
+            os.replace(temp_path, path)
+            
+            # Drop entries for older versions of the same source; other sizes and opacities stay
+            source_prefix, stamp, _ = os.path.basename(path).split("-")
+            for stale in glob.glob(os.path.join(self.directory, f"{source_prefix}-*.rgba")):
+                if os.path.basename(stale).split("-")[1] != stamp:
+                    os.remove(stale)
+        except OSError as e:
+            print(f"Error writing cached image {path}: {e}")
+
+
+class AudioEngine:
+    # Decoded sounds live in an LRU under a byte budget and play on reserved channel groups
+    MUSIC_END = pygame.USEREVENT + 1
+    CHANNEL_GROUPS = {"ui": 2, "feedback": 3, "animal": 2}
+    
+    def __init__(self, assets, budget_bytes, stream_bytes, free_channels=4):
+        self.assets = assets
+        self.budget_bytes = budget_bytes
+        self.stream_bytes = stream_bytes
+        self.sources = {}
+        self.pending = {}
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.long_plays = 0
+        # Long clips decoded for the current level, held until release_long()
+        self.level_sounds = {}
+        self.tracks = []
+        self.track_index = 0
         
-        for scale in [1.05, 1.1, 1.15, 1.2, 1.15, 1.1, 1.05, 1.0]:
-            self.match_scale = scale
-            draw_function()
+        # Reserved channels are never handed out by Sound.play(), so groups can't steal from each other
+        reserved = sum(self.CHANNEL_GROUPS.values())
+        pygame.mixer.set_num_channels(reserved + free_channels)
+        pygame.mixer.set_reserved(reserved)
+        self.channels = {}
+        index = 0
+        for group, count in self.CHANNEL_GROUPS.items():
+            self.channels[group] = [pygame.mixer.Channel(index + i) for i in range(count)]
+            index += count
+        self.channel_started = {}
+    
+    @staticmethod
+    def load_sound(path):
+        try:
+            return pygame.mixer.Sound(path)
+        except:
+            print(f"Error loading sound: {path}")
+            # Return a silent sound
+            return pygame.mixer.Sound(buffer=bytes([0]*44))
+    
+    def register(self, name, path, group):
+        self.sources[name] = (path, group)
+    
+    def is_long(self, path):
+        try:
+            return os.path.getsize(path) > self.stream_bytes
+        except OSError:
+            return False
+    
+    def prefetch(self, names):
+        for name in names:
+            path = self.sources[name][0]
+            if name in self.cache or name in self.pending or name in self.level_sounds:
+                continue
+            self.pending[name] = self.assets.submit(self.load_sound, path)
+    
+    def release_long(self, keep=()):
+        # Drop long clips decoded for an earlier level, played or not
+        for name in list(self.pending):
+            if name not in keep and self.is_long(self.sources[name][0]):
+                del self.pending[name]
+        for name in list(self.level_sounds):
+            if name not in keep:
+                del self.level_sounds[name]
+    
+    def sound(self, name):
+        entry = self.cache.get(name)
+        if entry is not None:
+            self.hits += 1
+            self.cache.move_to_end(name)
+            return entry[0]
+        
+        # Long clips were decoded on the asset pool when the level started. Boards with repeated
+        # animals play them again, so they stay out of the cache but live until the level ends.
+        sound = self.level_sounds.get(name)
+        if sound is not None:
+            self.long_plays += 1
+            return sound
+        
+        path = self.sources[name][0]
+        future = self.pending.pop(name, None)
+        sound = future.result() if future is not None else self.load_sound(path)
+        if self.is_long(path):
+            self.long_plays += 1
+            self.level_sounds[name] = sound
+            return sound
+        self.misses += 1
+        self.cache[name] = (sound, self.decoded_size(sound))
+        self.cache_bytes += self.cache[name][1]
+        self.evict()
+        return sound
+    
+    def decoded_size(self, sound):
+        frequency, size, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency * channels * abs(size) // 8)
+    
+    def evict(self):
+        while self.cache_bytes > self.budget_bytes and len(self.cache) > 1:
+            _, (sound, size) = self.cache.popitem(last=False)
+            self.cache_bytes -= size
+            self.evictions += 1
+    
+    def channel(self, group):
+        # Prefer an idle channel in the group, otherwise cut off the group's oldest sound
+        channels = self.channels[group]
+        for channel in channels:
+            if not channel.get_busy():
+                return channel
+        return min(channels, key=lambda c: self.channel_started.get(c, 0))
+    
+    def play(self, name):
+        if name not in self.sources:
+            return
+        sound = self.sound(name)
+        channel = self.channel(self.sources[name][1])
+        channel.play(sound)
+        self.channel_started[channel] = pygame.time.get_ticks()
+    
+    def start_music(self, tracks):
+        self.tracks = [track for track in tracks if os.path.exists(track)]
+        random.shuffle(self.tracks)
+        if not self.tracks:
+            return
+        try:
+            pygame.mixer.music.set_endevent(self.MUSIC_END)
+            pygame.mixer.music.load(self.tracks[0])
+            pygame.mixer.music.play()
+            self.queue_next_track()
+        except Exception as e:
+            print(f"Error playing background music: {e}")
+    
+    def queue_next_track(self):
+        # Queued tracks start as soon as the current one ends, without a gap
+        next_track = self.tracks[(self.track_index + 1) % len(self.tracks)]
+        try:
+            pygame.mixer.music.queue(next_track)
+        except Exception as e:
+            print(f"Error queueing background music: {e}")
+    
+    def handle_event(self, e):
+        if e.type == self.MUSIC_END and self.tracks:
+            self.track_index = (self.track_index + 1) % len(self.tracks)
+            self.queue_next_track()
+    
+    def set_volume(self, group, volume):
+        if group == "music":
+            pygame.mixer.music.set_volume(volume)
+        else:
+            for channel in self.channels[group]:
+                channel.set_volume(volume)
+    
+    def stats(self):
+        return {"cached": len(self.cache), "cache_bytes": self.cache_bytes, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions, "long_plays": self.long_plays}
+
+
+class SurfaceRegistry:
+    # Converts loaded surfaces to the display format once and pools fixed overlays
+    def __init__(self):
+        self.pool = {}
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.conversions = 0
+    
+    def adopt(self, surface):
+        self.conversions += 1
+        return surface.convert_alpha()
+    
+    def adopt_opaque(self, surface, matte=(0, 0, 0)):
+        # Flatten translucent images onto a solid matte so blits skip blending
+        flat = pygame.Surface(surface.get_size())
+        flat.fill(matte)
+        flat.blit(surface, (0, 0))
+        self.allocations += 1
+        self.conversions += 1
+        return flat.convert()
+    
+    def overlay(self, key, size, fill, decorate=None, alpha=True):
+        pool_key = (key, tuple(size))
+        with self.lock:
+            surface = self.pool.get(pool_key)
+            if surface is None:
+                surface = pygame.Surface(size, pygame.SRCALPHA) if alpha else pygame.Surface(size)
+                surface.fill(fill)
+                if decorate:
+                    decorate(surface)
+                self.pool[pool_key] = surface
+                self.allocations += 1
+        return surface
+    
+    def stats(self):
+        return {"pooled": len(self.pool), "allocations": self.allocations, "conversions": self.conversions}
+
+
+class CanvasView:
+    # A window that shows a fixed-size canvas: the game draws on the canvas, presents scale it into
+    # the window (letterboxed) and pointer positions are mapped back into canvas space
+    def __init__(self, display, canvas_size):
+        self.display = display
+        self.canvas = pygame.Surface(canvas_size).convert()
+        width, height = display.get_size()
+        scale = min(width / canvas_size[0], height / canvas_size[1])
+        size = (max(1, round(canvas_size[0] * scale)), max(1, round(canvas_size[1] * scale)))
+        self.rect = pygame.Rect(((width - size[0]) // 2, (height - size[1]) // 2), size)
+        self.target = display.subsurface(self.rect)
+        # Scaling a damaged rect on its own only samples the same pixels as a full scale when
+        # every canvas pixel becomes a whole block of window pixels
+        self.whole_scale = size[0] % canvas_size[0] == 0 and size[1] % canvas_size[1] == 0
+    
+    def present(self, rects=None):
+        # Nearest-neighbour: smoothscale costs over twice as much per frame on the CPU
+        bounds = self.canvas.get_rect()
+        if rects is None or not self.whole_scale or any(rect.contains(bounds) for rect in rects):
+            pygame.transform.scale(self.canvas, self.rect.size, self.target)
             pygame.display.flip()
-            pygame.time.delay(30)
+            return
+        
+        # Only the damaged parts of the canvas are scaled and pushed to the window
+        updates = []
+        for rect in rects:
+            rect = rect.clip(bounds)
+            if not rect.width or not rect.height:
+                continue
+            window = self.to_window(rect)
+            pygame.transform.scale(self.canvas.subsurface(rect), window.size, self.display.subsurface(window))
+            updates.append(window)
+        pygame.display.update(updates)
+    
+    def to_window(self, rect):
+        scale_x = self.rect.width // self.canvas.get_width()
+        scale_y = self.rect.height // self.canvas.get_height()
+        return pygame.Rect(self.rect.x + rect.x * scale_x, self.rect.y + rect.y * scale_y,
+                           rect.width * scale_x, rect.height * scale_y)
+    
+    def to_canvas(self, pos):
+        width, height = self.canvas.get_size()
+        x = (pos[0] - self.rect.x) * width // self.rect.width
+        y = (pos[1] - self.rect.y) * height // self.rect.height
+        return min(max(x, 0), width - 1), min(max(y, 0), height - 1)
+    
+    def map_events(self, events):
+        for e in events:
+            if e.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION):
+                e.pos = self.to_canvas(e.pos)
+
+
+class FrameProfiler:
+    # Opt-in per-phase frame timing with rolling percentiles, an on-screen overlay and a session trace
+    WINDOW = 600
+    TRACE_LIMIT = 500000
+    
+    def __init__(self, enabled=False, trace_path=None):
+        self.enabled = enabled
+        self.trace_path = trace_path or time.strftime("profile_trace_%Y%m%d-%H%M%S.csv")
+        self.frame_times = deque(maxlen=self.WINDOW)
+        self.phase_names = []
+        self.current = {}
+        self.trace = []
+        self.frame_start = time.perf_counter()
+        self.session_start = self.frame_start
+        self.font = None
+        self.session = {
+            "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver
+        }
+    
+    def phase(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return ProfilerPhase(self, name)
+    
+    def record(self, name, seconds):
+        if name not in self.phase_names:
+            self.phase_names.append(name)
+        self.current[name] = self.current.get(name, 0.0) + seconds * 1000
+    
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        frame_ms = (now - self.frame_start) * 1000
+        self.frame_start = now
+        self.frame_times.append(frame_ms)
+        if len(self.trace) < self.TRACE_LIMIT:
+            self.trace.append((round(now - self.session_start, 4), round(frame_ms, 3), self.current))
+        self.current = {}
+    
+    def percentiles(self):
+        times = sorted(self.frame_times)
+        if not times:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+        pick = lambda q: times[min(len(times) - 1, int(q * len(times)))]
+        return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+    
+    def draw(self, screen):
+        if not self.enabled or not self.trace:
+            return None
+        if self.font is None:
+            self.font = pygame.font.Font(None, 24)
+        
+        stats = self.percentiles()
+        last = self.trace[-1][2]
+        lines = [f"frame p50 {stats['p50']:.1f}  p95 {stats['p95']:.1f}  p99 {stats['p99']:.1f} ms"]
+        lines += [f"{name}: {last.get(name, 0.0):.2f} ms" for name in self.phase_names]
+        
+        surfaces = [self.font.render(line, True, (255, 255, 0)) for line in lines]
+        width = max(s.get_width() for s in surfaces) + 12
+        height = sum(s.get_height() for s in surfaces) + 12
+        rect = pygame.Rect(10, 10, width, height)
+        screen.fill((0, 0, 0), rect)
+        y = rect.y + 6
+        for surface in surfaces:
+            screen.blit(surface, (rect.x + 6, y))
+            y += surface.get_height()
+        return rect
+    
+    def dump(self):
+        if not self.enabled or not self.trace:
+            return
+        try:
+            if self.trace_path.endswith(".json"):
+                with open(self.trace_path, "w") as f:
+                    json.dump({
+                        "session": self.session,
+                        "summary": self.percentiles(),
+                        "phases": self.phase_names,
+                        "frames": [{"t": t, "frame_ms": ms, **phases} for t, ms, phases in self.trace]
+                    }, f)
+            else:
+                with open(self.trace_path, "w", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["t", "frame_ms"] + self.phase_names)
+                    for t, ms, phases in self.trace:
+                        writer.writerow([t, ms] + [round(phases.get(name, 0.0), 3) for name in self.phase_names])
+            print(f"Profile trace written to {self.trace_path}")
+        except OSError as e:
+            print(f"Error writing profile trace: {e}")
+
+
+class ProfilerPhase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+    
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class FrameScheduler:
+    # Full frame rate while something animates; otherwise block on the event queue until input
+    # or the next timer. Duty cycle is the share of wall time spent outside that wait.
+    # Per-minute summaries are appended to the log (rotated to one .1 backup), the last hour of them
+    # also goes into the profiler session, and they print only when profiling.
+    ACTIVE_FPS = 60
+    IDLE_MAX_MS = 1000
+    REPORT_SECONDS = 60
+    LOG_ROTATE_BYTES = 1024 * 1024
+    
+    def __init__(self, enabled=True, log_path=None, verbose=False):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.verbose = verbose
+        self.latency = LatencyProbe()
+        self.minutes = deque(maxlen=60)
+        self.frame_end = time.perf_counter()
+        self.reset_window(self.frame_end)
+    
+    def reset_window(self, now):
+        self.window_start = now
+        self.window_cpu = time.process_time()
+        self.work = 0.0
+        self.frames = 0
+        self.idle_frames = 0
+    
+    def tick(self, source, due_ms=0):
+        # due_ms is how soon the next frame is needed: 0 for now, None for only on input
+        start = time.perf_counter()
+        self.work += start - self.frame_end
+        self.frames += 1
+        
+        timeout = self.IDLE_MAX_MS if due_ms is None else min(int(due_ms), self.IDLE_MAX_MS)
+        if self.enabled and timeout > 1000 // self.ACTIVE_FPS:
+            self.idle_frames += 1
+            dt = source.tick(self.ACTIVE_FPS, timeout)
+        else:
+            dt = source.tick(self.ACTIVE_FPS)
+        
+        self.frame_end = time.perf_counter()
+        if self.frame_end - self.window_start >= self.REPORT_SECONDS:
+            self.report(self.frame_end)
+        return dt
+    
+    def report(self, now):
+        wall = now - self.window_start
+        minute = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "idle_scheduling": self.enabled,
+            "frames": self.frames,
+            "idle_frames": self.idle_frames,
+            "fps": round(self.frames / wall, 2),
+            "duty_cycle": round(self.work / wall, 4),
+            "cpu": round((time.process_time() - self.window_cpu) / wall, 4),
+            "input_latency_ms": self.latency.take_window()
+        }
+        self.minutes.append(minute)
+        self.write(minute)
+        self.reset_window(now)
+        if not self.verbose:
+            return
+        latency = minute["input_latency_ms"]
+        print(f"Last minute: {minute['fps']:.1f} fps, duty cycle {minute['duty_cycle']:.1%}, CPU {minute['cpu']:.1%}"
+              + (f", input-to-present p50 {latency['p50']:.1f} p95 {latency['p95']:.1f} p99 {latency['p99']:.1f} ms"
+                 if latency["count"] else ""))
+    
+    def close(self):
+        self.write({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "session_end": True,
+                    "input_latency_ms": self.latency.percentiles()})
+    
+    def write(self, record):
+        if not self.log_path:
+            return
+        try:
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.LOG_ROTATE_BYTES:
+                os.replace(self.log_path, f"{self.log_path}.1")
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        except OSError as e:
+            print(f"Error writing frame stats: {e}")
+
+
+class SaveStore:
+    # Player progress is kept in memory; a background thread batches writes into SQLite in WAL
+    # mode, so a crash mid-write never loses the last committed save and the frame never waits on disk
+    DEFAULT_STATE = (0, 1, 3)
+    
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.profiles = {}
+        self.queue = queue.Queue()
+        try:
+            connection = sqlite3.connect(path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS profiles "
+                               "(name TEXT PRIMARY KEY, score INTEGER, level INTEGER, energy INTEGER, updated REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, profile TEXT, level INTEGER, "
+                               "result TEXT, seconds REAL, mistakes INTEGER, score INTEGER, played REAL)")
+            connection.commit()
+            # Most recently played first
+            for name, score, level, energy in connection.execute(
+                    "SELECT name, score, level, energy FROM profiles ORDER BY updated DESC"):
+                self.profiles[name] = (score, level, energy)
+            connection.close()
+        except sqlite3.Error as e:
+            print(f"Error opening save store {path}: {e}")
         
-        self.match_scale = original_scale
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+        # Queued saves still land if the game exits without quit(), e.g. on an uncaught exception
+        atexit.register(self.close)
+        if not self.profiles and legacy_path:
+            self.import_legacy(legacy_path)
+    
+    def import_legacy(self, path):
+        # One-time move of the old single-player text save into the default profile
+        try:
+            with open(path, "r") as f:
+                score, level, energy = (int(f.readline()) for _ in range(3))
+        except (OSError, ValueError):
+            return
+        self.save("default", score, level, energy)
+        print(f"Imported {path} into profile 'default'")
+    
+    def players(self):
+        return list(self.profiles)
+    
+    def load(self, player):
+        return self.profiles.get(player, self.DEFAULT_STATE)
+    
+    def save(self, player, score, level, energy):
+        self.profiles[player] = (score, level, energy)
+        self.queue.put(("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)",
+                        (player, score, level, energy, time.time())))
+    
+    def record_level(self, player, level, result, seconds, mistakes, score):
+        self.queue.put(("INSERT INTO history (profile, level, result, seconds, mistakes, score, played) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", (player, level, result, seconds, mistakes, score, time.time())))
+    
+    def history(self, player, limit=20):
+        self.flush()
+        try:
+            connection = sqlite3.connect(self.path)
+            rows = connection.execute("SELECT level, result, seconds, mistakes, score, played FROM history "
+                                      "WHERE profile = ? ORDER BY id DESC LIMIT ?", (player, limit)).fetchall()
+            connection.close()
+            return rows
+        except sqlite3.Error as e:
+            print(f"Error reading level history: {e}")
+            return []
+    
+    def write_loop(self):
+        try:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            print(f"Error opening save store {self.path}: {e}")
+            connection = None
+        
+        while True:
+            # Everything queued since the last pass goes into one transaction
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            writes = [item for item in batch if item is not None]
+            if writes and connection:
+                try:
+                    with connection:
+                        for sql, params in writes:
+                            connection.execute(sql, params)
+                except sqlite3.Error as e:
+                    print(f"Error saving game: {e}")
+            for _ in batch:
+                self.queue.task_done()
+            if len(writes) < len(batch):
+                if connection:
+                    connection.close()
+                return
+    
+    def flush(self):
+        self.queue.join()
+    
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+
+class LatencyProbe:
+    # Input-to-present time: from when the loop first sees a click or key press to the end of the
+    # present() that shows its result. pygame doesn't expose SDL event timestamps, so input that
+    # queues up while a frame renders is only stamped when the next frame drains it.
+    def __init__(self, size=1024):
+        self.samples = deque(maxlen=size)
+        self.window = []
+        self.pending = None
+    
+    def received(self, events, woke_at=None):
+        if self.pending is None and any(e.type in InputRecorder.URGENT_EVENTS for e in events):
+            self.pending = woke_at or time.perf_counter()
+    
+    def presented(self):
+        if self.pending is not None:
+            ms = (time.perf_counter() - self.pending) * 1000
+            self.samples.append(ms)
+            self.window.append(ms)
+            self.pending = None
+    
+    def percentiles(self, samples=None):
+        ordered = sorted(self.samples if samples is None else samples)
+        if not ordered:
+            return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+        
+        def pick(q):
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+        
+        return {"count": len(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+    
+    def take_window(self):
+        stats = self.percentiles(self.window)
+        self.window = []
+        return stats
+
+
+class InputRecorder:
+    # Binary session log: a header, then one record per frame (or run of identical idle frames).
+    # Event times are the running sum of frame deltas, which is also what the game logic sees.
+    MAGIC = b"MGLOG"
+    VERSION = 2  # 2: each frame advances by its dt first, then applies that frame's input
+    URGENT_EVENTS = (pygame.MOUSEBUTTONDOWN, pygame.FINGERDOWN, pygame.KEYDOWN, pygame.QUIT)
+    HEADER = struct.Struct("<5sBQHHIHb")  # magic, version, seed, width, height, score, level, energy
+    RUN = struct.Struct("<HH")  # b"F": frame count, dt; frames without input
+    FRAME = struct.Struct("<HB")  # b"E": dt, event count, then the events
+    MOUSE = struct.Struct("<hhB")  # b"M": x, y, button
+    KEY = struct.Struct("<i")  # b"K": key
+    END = struct.Struct("<IHb")  # b"Z": final score, level, energy
+    
+    def __init__(self, clock, path, seed, resolution, start, view=None):
+        self.clock = clock
+        self.view = view
+        self.file = None
+        self.dt = 0
+        self.pending = []
+        self.woke_at = None
+        self.last_tick = time.perf_counter()
+        self.run_dt = 0
+        self.run_count = 0
+        if not path:
+            return
+        try:
+            self.file = open(path, "wb")
+            self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, seed, *resolution, *start))
+        except OSError as e:
+            print(f"Error opening input log {path}: {e}")
+            self.file = None
+    
+    def tick(self, fps, idle_ms=None):
+        # Sleep in the event queue until the frame is due. A click or key press ends the wait at once;
+        # any other event ends an idle wait once the frame-rate cap allows another frame.
+        earliest = self.last_tick + 1 / fps
+        deadline = max(earliest, self.last_tick + (idle_ms or 0) / 1000)
+        self.woke_at = None
+        while True:
+            remaining = int((deadline - time.perf_counter()) * 1000)
+            if remaining <= 0:
+                break
+            e = pygame.event.wait(remaining)
+            if e.type == pygame.NOEVENT:
+                break
+            self.pending.append(e)
+            if e.type in self.URGENT_EVENTS:
+                self.woke_at = time.perf_counter()
+                break
+            deadline = earliest
+        self.dt = self.clock.tick()
+        self.last_tick = time.perf_counter()
+        return self.dt
+    
+    def events(self):
+        events = self.pending + pygame.event.get()
+        self.pending = []
+        if self.view is not None:
+            # Positions are logged and handled in canvas space
+            self.view.map_events(events)
+        if self.file:
+            self.write_frame(min(self.dt, 0xFFFF), [record for record in map(self.encode, events) if record])
+        return events
+    
+    def encode(self, e):
+        if e.type == pygame.MOUSEBUTTONDOWN:
+            return b"M" + self.MOUSE.pack(*e.pos, e.button)
+        if e.type == pygame.KEYDOWN:
+            return b"K" + self.KEY.pack(e.key)
+        if e.type == pygame.QUIT:
+            return b"Q"
+        return None
+    
+    def write_frame(self, dt, records):
+        if not records and dt == self.run_dt and self.run_count < 0xFFFF:
+            self.run_count += 1
+            return
+        self.flush_run()
+        if records:
+            records = records[:0xFF]
+            self.file.write(b"E" + self.FRAME.pack(dt, len(records)) + b"".join(records))
+        else:
+            self.run_dt, self.run_count = dt, 1
+    
+    def flush_run(self):
+        if self.run_count:
+            self.file.write(b"F" + self.RUN.pack(self.run_count, self.run_dt))
+        self.run_count = 0
+    
+    def close(self, score, level, energy):
+        if not self.file:
+            return None
+        try:
+            self.flush_run()
+            self.file.write(b"Z" + self.END.pack(score, level, energy))
+            self.file.close()
+        except OSError as e:
+            print(f"Error writing input log: {e}")
+        self.file = None
+        return None
+
+
+class InputReplay:
+    # Feeds a recorded session back to the game loop with recorded frame deltas and no waiting
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, self.seed, width, height, *start = InputRecorder.HEADER.unpack_from(data)
+        if magic != InputRecorder.MAGIC or version != InputRecorder.VERSION:
+            raise ValueError(f"{path} is not a version {InputRecorder.VERSION} input log")
+        self.resolution = (width, height)
+        self.start = tuple(start)
+        self.final = None
+        self.frames = deque()
+        
+        offset = InputRecorder.HEADER.size
+        while offset < len(data):
+            kind = data[offset:offset + 1]
+            offset += 1
+            if kind == b"F":
+                count, dt = InputRecorder.RUN.unpack_from(data, offset)
+                offset += InputRecorder.RUN.size
+                self.frames.append([count, dt, []])
+            elif kind == b"E":
+                dt, count = InputRecorder.FRAME.unpack_from(data, offset)
+                offset += InputRecorder.FRAME.size
+                events = []
+                for _ in range(count):
+                    event, offset = self.decode(data, offset)
+                    events.append(event)
+                self.frames.append([1, dt, events])
+            elif kind == b"Z":
+                self.final = InputRecorder.END.unpack_from(data, offset)
+                break
+            else:
+                raise ValueError(f"Corrupt input log {path} at byte {offset - 1}")
+        
+        self.current = [0, 0, []]
+        self.woke_at = None
+        self.frame_count = 0
+        self.game_ms = 0
+        self.started = time.perf_counter()
+    
+    def decode(self, data, offset):
+        kind = data[offset:offset + 1]
+        offset += 1
+        if kind == b"M":
+            x, y, button = InputRecorder.MOUSE.unpack_from(data, offset)
+            return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=button), offset + InputRecorder.MOUSE.size
+        if kind == b"K":
+            key, = InputRecorder.KEY.unpack_from(data, offset)
+            return pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode=""), offset + InputRecorder.KEY.size
+        if kind == b"Q":
+            return pygame.event.Event(pygame.QUIT), offset
+        raise ValueError(f"Corrupt input event at byte {offset - 1}")
+    
+    def tick(self, fps, idle_ms=None):
+        if self.current[0] == 0:
+            # A log that stops without a quit (e.g. a crash) ends the replay there
+            self.current = self.frames.popleft() if self.frames else [1, 0, [pygame.event.Event(pygame.QUIT)]]
+        self.current[0] -= 1
+        self.frame_count += 1
+        self.game_ms += self.current[1]
+        return self.current[1]
+    
+    def events(self):
+        pygame.event.pump()
+        return self.current[2] if self.current[0] == 0 else []
+    
+    def close(self, score, level, energy):
+        wall = time.perf_counter() - self.started
+        print(f"Replayed {self.frame_count} frames ({self.game_ms / 1000:.1f}s of play) in {wall:.2f}s")
+        if self.final is None:
+            print("Recording has no final state to check against")
+            return 1
+        result = (score, level, energy)
+        if result != tuple(self.final):
+            print(f"Replay diverged: score/level/energy {result}, recorded {tuple(self.final)}")
+            return 1
+        print(f"Replay matches: score {score}, level {level}, energy {energy}")
+        return 0
+
+
+def canvas_size(value):
+    if not value:
+        return None
+    try:
+        width, height = (int(n) for n in value.lower().split("x"))
+    except ValueError:
+        print(f"Error reading canvas size {value!r}, expected WIDTHxHEIGHT")
+        return None
+    return (width, height) if width > 0 and height > 0 else None
+
+
+def option(name):
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+
+def replay(path):
+    # Re-run a recorded session headless, as fast as the game logic allows
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    log = InputReplay(path)
+    
+    # Start from the recorded progress without touching the real save store
+    with tempfile.TemporaryDirectory() as directory:
+        game = MemoryGame(profile=True if "--profile" in sys.argv else None, resolution=log.resolution,
+                          fullscreen=False, seed=log.seed, input_log=log, canvas="",
+                          save_path=os.path.join(directory, "game_save.db"))
+        game.score, game.level, game.energy = log.start
+        game.save_game()
+        game.menu()
 
 
 def main():
-    game = MemoryGame()
+    if option("--replay"):
+        replay(option("--replay"))
+    seed = option("--seed")
+    game = MemoryGame(profile=True if "--profile" in sys.argv else None, seed=int(seed) if seed else None,
+                      player=option("--player"), canvas=option("--canvas"))
+    if "--build-cache" in sys.argv:
+        game.build_asset_cache()
+        game.quit()
     game.menu()
 
 
@@ -0,0 +1,188 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from memory_model import GameModel, TIME_LIMITS, BOARD_SIZES, board_size, level_pair_ids
+
+# recall: chance a seen tile is remembered, forget: per-attempt chance a remembered tile is lost,
+# preview: chance a tile is remembered from the reveal at the start of the level
+MEMORY_MODELS = {
+    "perfect": {"recall": 1.0, "forget": 0.0, "preview": 0.25},
+    "good": {"recall": 0.9, "forget": 0.02, "preview": 0.15},
+    "average": {"recall": 0.75, "forget": 0.05, "preview": 0.1},
+    "poor": {"recall": 0.5, "forget": 0.1, "preview": 0.05}
+}
+IMAGE_COUNT = 21
+MAX_SECONDS = 600
+
+
+def parse_models(value):
+    # "average,poor" picks presets; "name:recall/forget/preview" defines a custom player
+    models = {}
+    for item in value.split(","):
+        name, _, params = item.strip().partition(":")
+        if params:
+            recall, forget, preview = (float(p) for p in params.split("/"))
+            models[name] = {"recall": recall, "forget": forget, "preview": preview}
+        else:
+            models[name] = MEMORY_MODELS[name]
+    return models
+
+
+def pick(rng, mask):
+    # One random True column per row; rows without any stay at -1
+    scores = np.where(mask, rng.random(mask.shape), -1.0)
+    choice = scores.argmax(axis=1)
+    return np.where(mask.any(axis=1), choice, -1)
+
+
+def simulate_level(rng, level, players, memory, flip_seconds, image_count=IMAGE_COUNT):
+    cols, rows = board_size(level)
+    tiles = cols * rows
+    pair_count = tiles // 2
+    base_ids = np.array(level_pair_ids(pair_count, image_count))
+    everyone = np.arange(players)
+    tile_index = np.arange(tiles)
+    
+    # One shuffled board per player
+    ids = base_ids[np.argsort(rng.random((players, tiles)), axis=1)]
+    id_slots = everyone[:, None] * image_count + ids
+    unfound = np.ones((players, tiles), dtype=bool)
+    known = rng.random((players, tiles)) < memory["preview"]
+    matched = np.zeros(players, dtype=np.int32)
+    mistakes = np.zeros(players, dtype=np.int32)
+    streak = np.zeros(players, dtype=np.int32)
+    streak_warnings = np.zeros(players, dtype=np.int32)
+    seconds = np.zeros(players)
+    active = np.ones(players, dtype=bool)
+    
+    # Every player makes one pair attempt per step until they clear the board or hit MAX_SECONDS;
+    # finished players keep riding along with their updates masked out
+    while active.any():
+        candidates = known & unfound
+        
+        # A remembered pair wins outright
+        counts = np.bincount(id_slots[candidates], minlength=players * image_count).reshape(players, image_count)
+        has_pair = counts.max(axis=1) >= 2
+        pair_mask = candidates & (ids == counts.argmax(axis=1)[:, None]) & has_pair[:, None]
+        
+        # Otherwise turn over something new, falling back to any face-down tile
+        unknown = unfound & ~known
+        first = np.where(has_pair, pick(rng, pair_mask), pick(rng, unknown))
+        first = np.where(first < 0, pick(rng, unfound), first)
+        first_id = ids[everyone, first]
+        not_first = tile_index[None, :] != first[:, None]
+        
+        # Second tile: the remembered partner if there is one, else another new tile
+        second = pick(rng, candidates & (ids == first_id[:, None]) & not_first)
+        second = np.where(second < 0, pick(rng, unknown & not_first), second)
+        second = np.where(second < 0, pick(rng, unfound & not_first), second)
+        
+        # Both tiles are seen now; each sticks with the recall probability
+        recalled = rng.random((players, 2)) < memory["recall"]
+        known[everyone[active & recalled[:, 0]], first[active & recalled[:, 0]]] = True
+        known[everyone[active & recalled[:, 1]], second[active & recalled[:, 1]]] = True
+        
+        is_match = (first_id == ids[everyone, second]) & active
+        unfound[everyone[is_match], first[is_match]] = False
+        unfound[everyone[is_match], second[is_match]] = False
+        
+        # Forgetting happens between attempts
+        known &= rng.random((players, tiles)) >= memory["forget"]
+        
+        missed = active & ~is_match
+        matched += is_match
+        mistakes += missed
+        streak = np.where(is_match, 0, streak + missed)
+        warned = streak == GameModel.MISTAKE_LIMIT
+        streak_warnings += warned
+        streak[warned] = 0
+        
+        # The game timer only runs while the player can act, so only think time counts
+        seconds += np.where(active, rng.lognormal(np.log(flip_seconds), 0.35, (players, 2)).sum(axis=1), 0)
+        active &= (matched < pair_count) & (seconds < MAX_SECONDS)
+    
+    completion = np.sort(np.where(matched == pair_count, seconds, np.inf))
+    
+    def percentile(q):
+        value = completion[int(q / 100 * (players - 1))]
+        return round(float(value), 2) if np.isfinite(value) else None
+    
+    return {
+        "board": f"{cols}x{rows}",
+        "pairs": pair_count,
+        "completion_seconds": {f"p{q}": percentile(q) for q in (10, 25, 50, 75, 90)},
+        "completion": completion,
+        "mean_mistakes": round(float(mistakes.mean()), 2),
+        "mean_streak_warnings": round(float(streak_warnings.mean()), 2)
+    }
+
+
+def win_rates(completion, limits):
+    return {str(limit): round(float((completion <= limit).mean()), 4) for limit in limits}
+
+
+def recommend_time_limit(completion, target, step=30):
+    # Shortest whole number of steps that lets the target share of players through
+    needed = completion[min(len(completion) - 1, int(np.ceil(target * len(completion))) - 1)]
+    if not np.isfinite(needed):
+        return MAX_SECONDS
+    return int(max(step, np.ceil(needed / step) * step))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-simulate memory game levels for many players at once")
+    parser.add_argument("--levels", type=int, default=len(BOARD_SIZES), help="simulate levels 1..N")
+    parser.add_argument("--players", type=int, default=10000, help="simulated players per level and memory model")
+    parser.add_argument("--models", default="good,average,poor", help="presets (%s) or name:recall/forget/preview" % ", ".join(MEMORY_MODELS))
+    parser.add_argument("--flip-seconds", type=float, default=1.2, help="median think time per flip")
+    parser.add_argument("--tune-model", default="average", help="memory model the time limits are tuned for")
+    parser.add_argument("--target-win-rate", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="difficulty.json", help="difficulty table the game loads at startup")
+    args = parser.parse_args()
+    
+    models = parse_models(args.models)
+    if args.tune_model not in models:
+        parser.error(f"--tune-model {args.tune_model} is not one of the simulated models")
+    rng = np.random.default_rng(args.seed)
+    
+    levels = {}
+    start = time.perf_counter()
+    for level in range(1, args.levels + 1):
+        results = {name: simulate_level(rng, level, args.players, memory, args.flip_seconds)
+                   for name, memory in models.items()}
+        time_limit = recommend_time_limit(results[args.tune_model]["completion"], args.target_win_rate)
+        limits = sorted(set(TIME_LIMITS + [time_limit]))
+        for result in results.values():
+            result["win_rate"] = win_rates(result.pop("completion"), limits)
+        
+        levels[str(level)] = {
+            "board": results[args.tune_model]["board"],
+            "time_limit": time_limit,
+            "models": results
+        }
+        print(f"level {level} {levels[str(level)]['board']}: time limit {time_limit}s, "
+              f"{args.tune_model} win rates {results[args.tune_model]['win_rate']}", file=sys.stderr)
+    
+    table = {
+        "version": 1,
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "players": args.players,
+        "flip_seconds": args.flip_seconds,
+        "tune_model": args.tune_model,
+        "target_win_rate": args.target_win_rate,
+        "seed": args.seed,
+        "memory_models": models,
+        "levels": levels
+    }
+    with open(args.output, "w") as f:
+        json.dump(table, f, indent=2)
+    print(f"Wrote {args.output} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
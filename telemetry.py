@@ -0,0 +1,243 @@
+import argparse
+import atexit
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+
+# Event kinds and the names of their two integer fields
+FLIP = 1
+MATCH = 2
+MISMATCH = 3
+TIMEOUT = 4
+LEVEL_CLEAR = 5
+ABANDON = 6
+GAME_OVER = 7
+EVENTS = {
+    FLIP: ("flip", "tile", "since_last_ms"),
+    MATCH: ("match", "tile", "latency_ms"),
+    MISMATCH: ("mismatch", "tile", "latency_ms"),
+    TIMEOUT: ("timeout", "elapsed_ms", "tries_left"),
+    LEVEL_CLEAR: ("level_clear", "elapsed_ms", "mistakes"),
+    ABANDON: ("abandon", "elapsed_ms", "reason"),
+    GAME_OVER: ("game_over", "elapsed_ms", "score")
+}
+# Abandon reasons
+BACK_BUTTON = 1
+ESCAPE = 2
+
+
+class Telemetry:
+    # Gameplay events go into preallocated parallel arrays; record() only stores numbers and bumps
+    # a counter. A background thread turns whatever is new into gzipped JSONL and rotates files,
+    # deleting the oldest files in the directory once together they pass RETAIN_BYTES.
+    CAPACITY = 4096
+    FLUSH_SECONDS = 5
+    ROTATE_BYTES = 1024 * 1024
+    RETAIN_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, directory, session, capacity=CAPACITY):
+        self.directory = directory
+        self.session = session
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.kinds = array("B", bytes(capacity))
+        self.levels = array("H", bytes(2 * capacity))
+        self.first = array("l", bytes(array("l").itemsize * capacity))
+        self.second = array("l", bytes(array("l").itemsize * capacity))
+        self.written = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.part = 0
+        self.path = None
+        self.started = time.perf_counter()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.writer = None
+        if directory:
+            self.writer = threading.Thread(target=self.flush_loop, daemon=True)
+            self.writer.start()
+            atexit.register(self.close)
+
+    def record(self, kind, level, first=0, second=0):
+        if not self.writer:
+            return
+        slot = self.written % self.capacity
+        self.times[slot] = time.perf_counter() - self.started
+        self.kinds[slot] = kind
+        self.levels[slot] = level
+        self.first[slot] = first
+        self.second[slot] = second
+        # Publish the slot only after every field is in place
+        self.written += 1
+        if self.written - self.flushed >= self.capacity // 2:
+            self.wake.set()
+
+    def flush_loop(self):
+        while not self.stopping:
+            self.wake.wait(self.FLUSH_SECONDS)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        end = self.written
+        start = self.flushed
+        if end - start > self.capacity:
+            # The game lapped the buffer faster than we could drain it
+            self.dropped += end - start - self.capacity
+            start = end - self.capacity
+        if end == start:
+            return
+
+        lines = []
+        for index in range(start, end):
+            slot = index % self.capacity
+            name, first_name, second_name = EVENTS[self.kinds[slot]]
+            lines.append(json.dumps({
+                "session": self.session,
+                "t": round(self.times[slot], 3),
+                "event": name,
+                "level": self.levels[slot],
+                first_name: self.first[slot],
+                second_name: self.second[slot]
+            }, separators=(",", ":")))
+        self.flushed = end
+
+        try:
+            if self.path is None or os.path.getsize(self.path) >= self.ROTATE_BYTES:
+                os.makedirs(self.directory, exist_ok=True)
+                self.part += 1
+                self.path = os.path.join(self.directory, f"{self.session}-{self.part:03d}.jsonl.gz")
+                self.prune()
+            # Each flush appends a gzip member; readers see one continuous stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Error writing telemetry: {e}")
+
+    def prune(self):
+        # Oldest first, by modification time; the file about to be written is never counted
+        files = []
+        for path in glob.glob(os.path.join(self.directory, "*.jsonl.gz")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        total = sum(size for _, _, size in files)
+        for _, path, size in files:
+            if total <= self.RETAIN_BYTES:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing old telemetry {path}: {e}")
+            total -= size
+    
+    def close(self):
+        if self.writer and self.writer.is_alive():
+            self.stopping = True
+            self.wake.set()
+            self.writer.join()
+            atexit.unregister(self.close)
+
+
+def read_events(paths):
+    for path in paths:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (OSError, EOFError) as e:
+            # A session that crashed mid-flush leaves a truncated last member
+            print(f"Skipping rest of {path}: {e}", file=sys.stderr)
+
+
+def summarize(events):
+    # One streaming pass; memory grows with the number of levels, not sessions or events
+    sessions = set()
+    levels = {}
+    for event in events:
+        sessions.add(event["session"])
+        stats = levels.setdefault(event["level"], {
+            "flips": 0, "flip_ms": 0, "matches": 0, "mismatches": 0, "latency_ms": 0,
+            "clears": 0, "clear_ms": 0, "clear_mistakes": 0, "timeouts": 0, "abandons": 0,
+            "abandon_ms": 0, "abandon_back": 0, "abandon_escape": 0, "game_overs": 0
+        })
+        name = event["event"]
+        if name == "flip":
+            stats["flips"] += 1
+            stats["flip_ms"] += event["since_last_ms"]
+        elif name in ("match", "mismatch"):
+            stats["matches" if name == "match" else "mismatches"] += 1
+            stats["latency_ms"] += event["latency_ms"]
+        elif name == "level_clear":
+            stats["clears"] += 1
+            stats["clear_ms"] += event["elapsed_ms"]
+            stats["clear_mistakes"] += event["mistakes"]
+        elif name == "timeout":
+            stats["timeouts"] += 1
+        elif name == "abandon":
+            stats["abandons"] += 1
+            stats["abandon_ms"] += event["elapsed_ms"]
+            stats["abandon_back" if event["reason"] == BACK_BUTTON else "abandon_escape"] += 1
+        elif name == "game_over":
+            stats["game_overs"] += 1
+
+    def mean(total, count):
+        return round(total / count, 1) if count else None
+
+    summary = {}
+    for level in sorted(levels):
+        stats = levels[level]
+        attempts = stats["clears"] + stats["timeouts"] + stats["abandons"]
+        summary[str(level)] = {
+            "attempts": attempts,
+            "clear_rate": round(stats["clears"] / attempts, 4) if attempts else None,
+            "mean_ms_per_flip": mean(stats["flip_ms"], stats["flips"]),
+            "mean_match_latency_ms": mean(stats["latency_ms"], stats["matches"] + stats["mismatches"]),
+            "match_rate": round(stats["matches"] / (stats["matches"] + stats["mismatches"]), 4)
+                          if stats["matches"] + stats["mismatches"] else None,
+            "mean_clear_seconds": mean(stats["clear_ms"] / 1000, stats["clears"]),
+            "mean_mistakes_per_clear": mean(stats["clear_mistakes"], stats["clears"]),
+            "timeouts": stats["timeouts"],
+            "abandons": {"back_button": stats["abandon_back"], "escape": stats["abandon_escape"],
+                         "mean_seconds_in": mean(stats["abandon_ms"] / 1000, stats["abandons"])},
+            "game_overs": stats["game_overs"]
+        }
+    return {"sessions": len(sessions), "levels": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize gameplay telemetry files per level")
+    parser.add_argument("paths", nargs="*", default=["telemetry"], help="telemetry directories or .jsonl.gz files")
+    parser.add_argument("--output", help="write the summary here instead of stdout")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        files += sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))) if os.path.isdir(path) else [path]
+
+    start = time.perf_counter()
+    summary = summarize(read_events(files))
+    summary["files"] = len(files)
+    text = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    print(f"Summarized {len(files)} files in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+from memory_model import FOUND, MATCH, MISMATCH, MISMATCH_LIMIT, REVEALED, GameModel
+
+
+def make_model(pair_ids=(0, 1, 0, 1), time_limit=30, **kwargs):
+    model = GameModel(**kwargs)
+    model.new_level(2, len(pair_ids) // 2, list(pair_ids), time_limit)
+    return model
+
+
+def pick(model, first, second):
+    assert model.flip(first)
+    assert model.flip(second)
+    return model.resolve()
+
+
+def test_flip_rejects_revealed_found_and_third_tiles():
+    model = make_model()
+    assert model.flip(0)
+    assert not model.flip(0)  # already face up
+    assert model.flip(1)
+    assert model.pair_ready
+    assert not model.flip(2)  # a pair is waiting to be resolved
+    assert model.state[2] == 0
+
+    model.hide(*model.resolve()[1:])
+    assert pick(model, 0, 2)[0] == MATCH
+    assert not model.flip(0)  # already found
+
+
+def test_match_scores_and_marks_both_tiles_found():
+    model = make_model(score=10)
+    result, first, second = pick(model, 1, 3)
+    assert (result, first, second) == (MATCH, 1, 3)
+    assert model.score == 10 + GameModel.MATCH_POINTS
+    assert model.matched == 1
+    assert model.state[1] == model.state[3] == REVEALED | FOUND
+    assert not model.complete
+
+    pick(model, 0, 2)
+    assert model.complete
+
+
+def test_mismatch_leaves_tiles_revealed_until_hidden():
+    model = make_model(score=10)
+    result, first, second = pick(model, 0, 1)
+    assert result == MISMATCH
+    assert model.score == 10
+    assert model.revealed(0) and model.revealed(1)
+    model.hide(first, second)
+    assert not model.revealed(0) and not model.revealed(1)
+
+
+def test_mismatch_limit_resets_the_streak():
+    model = make_model()
+    results = []
+    for _ in range(GameModel.MISTAKE_LIMIT + 1):
+        result, first, second = pick(model, 0, 1)
+        model.hide(first, second)
+        results.append(result)
+    assert results == [MISMATCH, MISMATCH, MISMATCH_LIMIT, MISMATCH]
+    assert model.consecutive_mistakes == 1
+    assert model.mistakes == GameModel.MISTAKE_LIMIT + 1
+
+
+def test_match_clears_the_mismatch_streak():
+    model = make_model()
+    model.hide(*pick(model, 0, 1)[1:])
+    model.hide(*pick(model, 0, 1)[1:])
+    pick(model, 0, 2)
+    assert model.consecutive_mistakes == 0
+    assert pick(model, 1, 3)[0] == MATCH
+
+
+def test_tick_times_out_once_at_the_limit():
+    model = make_model(time_limit=2)
+    assert not model.tick(1999)
+    assert model.time_left == 1
+    assert model.tick(1)
+    assert model.time_left == 0
+    assert not model.tick(1000)  # already timed out
+
+
+def test_tick_stops_once_the_board_is_complete():
+    model = make_model(time_limit=2)
+    pick(model, 0, 2)
+    pick(model, 1, 3)
+    assert not model.tick(5000)
+    assert model.elapsed_ms == 0
+
+
+def test_lose_try_and_complete_level():
+    model = make_model(level=3, tries=2)
+    assert model.lose_try() == 1
+    assert model.lose_try() == 0
+    model.complete_level()
+    assert model.level == 4
+
+    model.new_level(2, 2, [0, 0, 1, 1], 30)
+    assert model.matched == 0 and model.mistakes == 0 and model.elapsed_ms == 0
+    assert not any(model.state)
+    assert model.state[0] & FOUND == 0